@@ -0,0 +1,52 @@
+import sqlalchemy as sa
+from flask import request
+from app import db
+from app.models import User, Post
+from app.api import bp
+from app.api.auth import token_auth
+from app.api.errors import bad_request
+from app.api.fields import USER_FIELDS, USER_DEFAULT, POST_FIELDS, \
+    POST_DEFAULT, field_names, columns, to_dict, is_id
+
+MAX_BATCH_SIZE = 100
+
+RESOURCES = {
+    'users': (User.id, USER_FIELDS, USER_DEFAULT),
+    'posts': (Post.id, POST_FIELDS, POST_DEFAULT),
+}
+
+
+@bp.route('/batch', methods=['POST'])
+@token_auth.login_required
+def get_batch():
+    """Resolve many user and post ids with one query per resource type.
+
+    The request body looks like ``{"posts": [1, 2], "users": [3],
+    "fields": {"posts": ["id", "title"]}}``. Results come back in the order
+    the ids were given, and ids that do not exist are left out.
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return bad_request('the request body must be a JSON object')
+    requested_fields = data.get('fields') or {}
+    if not isinstance(requested_fields, dict):
+        return bad_request('fields must map resource names to field lists')
+    response = {}
+    for name, (id_column, fields, default) in RESOURCES.items():
+        ids = data.get(name)
+        if ids is None:
+            continue
+        if not isinstance(ids, list) or \
+                not all(is_id(id) for id in ids):
+            return bad_request(f'{name} must be a list of ids')
+        if len(ids) > MAX_BATCH_SIZE:
+            return bad_request(
+                f'at most {MAX_BATCH_SIZE} {name} can be fetched at once')
+        names = field_names(fields, default, requested_fields.get(name) or [])
+        rows = db.session.execute(
+            sa.select(*columns(fields, names), id_column.label('_id'))
+            .where(id_column.in_(ids))
+        ).mappings()
+        found = {row['_id']: to_dict(row) for row in rows}
+        response[name] = [found[id] for id in ids if id in found]
+    return response
@@ -0,0 +1,169 @@
+import base64
+import json
+from datetime import datetime, timezone
+from flask import request, url_for, abort
+import sqlalchemy as sa
+from app import app, db
+from app.models import User, Post, Quest, followers, post_users, \
+    quest_participants
+
+# Columns each resource can return, keyed by field name. Counts are
+# correlated subqueries, so they are only part of the query (and only cost
+# anything) when a client asks for them with ?fields=.
+USER_FIELDS = {
+    'id': User.id,
+    'username': User.username,
+    'about_me': User.about_me,
+    'last_seen': User.last_seen,
+    'profile_pic': User.profile_pic,
+    'post_count': sa.select(sa.func.count(Post.id))
+    .where(Post.user_id == User.id).scalar_subquery(),
+    'follower_count': sa.select(sa.func.count())
+    .where(followers.c.followed_id == User.id).scalar_subquery(),
+    'following_count': sa.select(sa.func.count())
+    .where(followers.c.follower_id == User.id).scalar_subquery(),
+}
+USER_DEFAULT = ('id', 'username', 'about_me', 'last_seen', 'profile_pic')
+
+POST_FIELDS = {
+    'id': Post.id,
+    'title': Post.title,
+    'body': Post.body,
+    'timestamp': Post.timestamp,
+    'due_date': Post.due_date,
+    'image_file': Post.image_file,
+    'author_id': Post.user_id,
+    'participant_count': sa.select(sa.func.count())
+    .where(post_users.c.post_id == Post.id).scalar_subquery(),
+}
+POST_DEFAULT = ('id', 'title', 'body', 'timestamp', 'due_date', 'image_file',
+                'author_id')
+
+QUEST_FIELDS = {
+    'id': Quest.id,
+    'title': Quest.title,
+    'description': Quest.description,
+    'created_at': Quest.created_at,
+    'deadline': Quest.deadline,
+    'progress': Quest.progress,
+    'creator_id': Quest.creator_id,
+    'image_file': Quest.image_file,
+    'participant_count': sa.select(sa.func.count())
+    .where(quest_participants.c.quest_id == Quest.id).scalar_subquery(),
+}
+QUEST_DEFAULT = ('id', 'title', 'description', 'created_at', 'deadline',
+                 'progress', 'creator_id', 'image_file')
+
+MAX_PAGE_SIZE = 100
+
+
+def field_names(fields, default, requested=None):
+    """Validate the requested field names, falling back to `default`."""
+    if requested is None:
+        requested = request.args.get('fields')
+    if isinstance(requested, str):
+        requested = [name.strip() for name in requested.split(',')]
+    if not requested:
+        return list(default)
+    if not isinstance(requested, list) or \
+            not all(isinstance(name, str) for name in requested):
+        abort(400, 'fields must be a list of field names')
+    names = [name for name in requested if name]
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        abort(400, f'Unknown fields: {", ".join(unknown)}')
+    return names
+
+
+def columns(fields, names):
+    return [fields[name].label(name) for name in names]
+
+
+def _to_json(value):
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=timezone.utc).isoformat()
+    return value
+
+
+def to_dict(row):
+    """Serialize a result row, skipping internal (underscore) columns."""
+    return {key: _to_json(value) for key, value in row.items()
+            if not key.startswith('_')}
+
+
+def _encode_cursor(values):
+    data = json.dumps([_to_json(value) for value in values])
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def is_id(value):
+    """Tell whether a client-supplied value can be a row id.
+
+    Anything else, including booleans and integers beyond 64 bits, would
+    fail in the database driver rather than simply match nothing.
+    """
+    return type(value) is int and 0 < value < 2 ** 63
+
+
+def _decode_key(key, value):
+    if isinstance(key.type, sa.DateTime):
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+    if isinstance(key.type, sa.Integer) and is_id(value):
+        return value
+    if isinstance(key.type, sa.String) and isinstance(value, str):
+        return value
+    raise ValueError(value)
+
+
+def _decode_cursor(cursor, keys):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError(cursor)
+        return [_decode_key(key, value) for key, value in zip(keys, values)]
+    except (ValueError, TypeError):
+        abort(400, 'Invalid cursor')
+
+
+def paginate(query, keys, endpoint, descending=True, **kwargs):
+    """Run `query` one keyset page at a time and build a collection payload.
+
+    `keys` are the columns the collection is ordered by and must end with a
+    unique column. The page position is carried in an opaque cursor holding
+    the keys of the last row, so every page is a single index range scan no
+    matter how deep the client has paged.
+    """
+    limit = request.args.get('limit', app.config['POSTS_PER_PAGE'], type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    fields = request.args.get('fields')
+    cursor = request.args.get('cursor')
+    labels = [f'_key{i}' for i in range(len(keys))]
+    query = query.add_columns(*[key.label(label)
+                                for key, label in zip(keys, labels)])
+    if cursor:
+        position = sa.tuple_(*keys)
+        values = sa.tuple_(*_decode_cursor(cursor, keys))
+        query = query.where(position < values if descending
+                            else position > values)
+    query = query.order_by(*[key.desc() if descending else key
+                             for key in keys]).limit(limit + 1)
+    rows = db.session.execute(query).mappings().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor([rows[-1][label] for label in labels])
+    return {
+        'items': [to_dict(row) for row in rows],
+        '_meta': {
+            'limit': limit,
+            'next_cursor': next_cursor,
+        },
+        '_links': {
+            'self': url_for(endpoint, limit=limit, fields=fields,
+                            cursor=cursor, **kwargs),
+            'next': url_for(endpoint, limit=limit, fields=fields,
+                            cursor=next_cursor, **kwargs)
+            if next_cursor else None,
+        }
+    }
+
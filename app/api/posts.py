@@ -0,0 +1,40 @@
+import sqlalchemy as sa
+from flask import abort
+from app import db
+from app.models import Post, followers
+from app.api import bp
+from app.api.auth import token_auth
+from app.api.fields import POST_FIELDS, POST_DEFAULT, field_names, columns, \
+    to_dict, paginate
+
+
+@bp.route('/posts/<int:id>', methods=['GET'])
+@token_auth.login_required
+def get_post(id):
+    names = field_names(POST_FIELDS, POST_DEFAULT)
+    row = db.session.execute(
+        sa.select(*columns(POST_FIELDS, names)).where(Post.id == id)
+    ).mappings().first()
+    if row is None:
+        abort(404)
+    return to_dict(row)
+
+
+@bp.route('/posts', methods=['GET'])
+@token_auth.login_required
+def get_posts():
+    names = field_names(POST_FIELDS, POST_DEFAULT)
+    query = sa.select(*columns(POST_FIELDS, names))
+    return paginate(query, [Post.timestamp, Post.id], 'api.get_posts')
+
+
+@bp.route('/timeline', methods=['GET'])
+@token_auth.login_required
+def get_timeline():
+    user = token_auth.current_user()
+    names = field_names(POST_FIELDS, POST_DEFAULT)
+    followed = sa.select(followers.c.followed_id).where(
+        followers.c.follower_id == user.id)
+    query = sa.select(*columns(POST_FIELDS, names)).where(sa.or_(
+        Post.user_id == user.id, Post.user_id.in_(followed)))
+    return paginate(query, [Post.timestamp, Post.id], 'api.get_timeline')
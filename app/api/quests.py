@@ -0,0 +1,28 @@
+import sqlalchemy as sa
+from flask import abort
+from app import db
+from app.models import Quest
+from app.api import bp
+from app.api.auth import token_auth
+from app.api.fields import QUEST_FIELDS, QUEST_DEFAULT, field_names, \
+    columns, to_dict, paginate
+
+
+@bp.route('/quests/<int:id>', methods=['GET'])
+@token_auth.login_required
+def get_quest(id):
+    names = field_names(QUEST_FIELDS, QUEST_DEFAULT)
+    row = db.session.execute(
+        sa.select(*columns(QUEST_FIELDS, names)).where(Quest.id == id)
+    ).mappings().first()
+    if row is None:
+        abort(404)
+    return to_dict(row)
+
+
+@bp.route('/quests', methods=['GET'])
+@token_auth.login_required
+def get_quests():
+    names = field_names(QUEST_FIELDS, QUEST_DEFAULT)
+    query = sa.select(*columns(QUEST_FIELDS, names))
+    return paginate(query, [Quest.created_at, Quest.id], 'api.get_quests')
@@ -0,0 +1,37 @@
+import sqlalchemy as sa
+from flask import abort
+from app import db
+from app.models import User, Post
+from app.api import bp
+from app.api.auth import token_auth
+from app.api.fields import USER_FIELDS, USER_DEFAULT, POST_FIELDS, \
+    POST_DEFAULT, field_names, columns, to_dict, paginate
+
+
+@bp.route('/users/<int:id>', methods=['GET'])
+@token_auth.login_required
+def get_user(id):
+    names = field_names(USER_FIELDS, USER_DEFAULT)
+    row = db.session.execute(
+        sa.select(*columns(USER_FIELDS, names)).where(User.id == id)
+    ).mappings().first()
+    if row is None:
+        abort(404)
+    return to_dict(row)
+
+
+@bp.route('/users', methods=['GET'])
+@token_auth.login_required
+def get_users():
+    names = field_names(USER_FIELDS, USER_DEFAULT)
+    query = sa.select(*columns(USER_FIELDS, names))
+    return paginate(query, [User.id], 'api.get_users', descending=False)
+
+
+@bp.route('/users/<int:id>/posts', methods=['GET'])
+@token_auth.login_required
+def get_user_posts(id):
+    names = field_names(POST_FIELDS, POST_DEFAULT)
+    query = sa.select(*columns(POST_FIELDS, names)).where(Post.user_id == id)
+    return paginate(query, [Post.timestamp, Post.id], 'api.get_user_posts',
+                    id=id)
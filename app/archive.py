@@ -0,0 +1,82 @@
+import time
+from datetime import datetime, timedelta, timezone
+import sqlalchemy as sa
+from app import app, db
+from app.models import Post, ArchivedPost, PostTrend, post_users, \
+    post_users_archive
+
+POST_COLUMNS = ['id', 'title', 'body', 'timestamp', 'user_id', 'image_file',
+                'due_date']
+
+
+def archive_cutoff(now=None):
+    now = now or datetime.now(timezone.utc)
+    return (now - timedelta(days=app.config['ARCHIVE_AFTER_DAYS'])).replace(
+        tzinfo=None)
+
+
+def archive_batch(ids):
+    """Move the posts with the given ids, and who joined them, to the
+    archive tables in one transaction."""
+    post = Post.__table__
+    db.session.execute(sa.insert(ArchivedPost.__table__).from_select(
+        POST_COLUMNS, sa.select(*[post.c[name] for name in POST_COLUMNS])
+        .where(post.c.id.in_(ids))))
+    db.session.execute(sa.insert(post_users_archive).from_select(
+        ['user_id', 'post_id', 'timestamp'],
+        sa.select(post_users.c.user_id, post_users.c.post_id,
+                  post_users.c.timestamp)
+        .where(post_users.c.post_id.in_(ids))))
+    db.session.execute(sa.delete(post_users).where(
+        post_users.c.post_id.in_(ids)))
+    db.session.execute(sa.delete(PostTrend).where(PostTrend.post_id.in_(ids)))
+    db.session.execute(sa.delete(post).where(post.c.id.in_(ids)))
+    db.session.commit()
+
+
+def archive_posts(now=None, batch_size=None, pause=0.0, max_batches=None):
+    """Archive posts due more than ARCHIVE_AFTER_DAYS ago.
+
+    Posts are moved `batch_size` at a time, each batch in its own short
+    transaction, optionally sleeping `pause` seconds in between to leave
+    room for the live traffic. Returns the number of posts archived.
+    """
+    cutoff = archive_cutoff(now)
+    batch_size = batch_size or app.config['ARCHIVE_BATCH_SIZE']
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = db.session.scalars(
+            sa.select(Post.id).where(Post.due_date < cutoff)
+            .order_by(Post.due_date).limit(batch_size)).all()
+        if not ids:
+            break
+        archive_batch(ids)
+        archived += len(ids)
+        batches += 1
+        if pause:
+            time.sleep(pause)
+    return archived
+
+
+def user_posts_page(user, page, per_page):
+    """Return a page of a user's posts, newest first, and whether there is
+    a next page.
+
+    Pages run through the user's posts in the live table first and then
+    carry on into their archived posts.
+    """
+    start = (page - 1) * per_page
+    live = db.session.scalar(
+        sa.select(sa.func.count(Post.id)).where(Post.user_id == user.id))
+    posts = []
+    if start < live:
+        posts = db.session.scalars(
+            user.posts.select().order_by(Post.timestamp.desc())
+            .offset(start).limit(per_page + 1)).all()
+    if len(posts) <= per_page:
+        posts += db.session.scalars(
+            sa.select(ArchivedPost).where(ArchivedPost.user_id == user.id)
+            .order_by(ArchivedPost.timestamp.desc())
+            .offset(max(start - live, 0))
+            .limit(per_page + 1 - len(posts))).all()
+    return posts[:per_page], len(posts) > per_page
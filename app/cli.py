@@ -0,0 +1,367 @@
+import csv
+import json
+import os
+from datetime import datetime
+from functools import partial
+from itertools import islice
+from operator import itemgetter
+import click
+import sqlalchemy as sa
+from app import app, db
+from app.models import import_checkpoint
+from app.quests import rebuild_stats
+from app.recommendations import update_suggestions
+from app.trending import refresh_trending, rebuild_trending
+from app.archive import archive_posts
+
+# Tables in foreign-key-safe order: every table comes after the ones it
+# references, so an import never inserts a row before its parent exists.
+TABLES = ('user', 'quest', 'post', 'followers', 'quest_participants',
+          'post_users', 'post_archive', 'post_users_archive')
+FORMATS = ('ndjson', 'csv')
+# Tables holding rows moved out of another table with their ids, which the
+# other table must never reuse.
+ID_SHARERS = {'post': ('post_archive',)}
+
+
+def _table(name):
+    return db.metadata.tables[name]
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _decoder(column, fmt, dialect):
+    """Return a function converting a column of serialized values for
+    `column` to what the database driver takes, or None when they can be
+    passed as read.
+
+    Rows are handed to the driver directly, so the column type's own bind
+    processing is folded in here. For NDJSON only datetimes need any work.
+    """
+    convert = None
+    if isinstance(column.type, sa.DateTime):
+        convert = datetime.fromisoformat
+    elif isinstance(column.type, sa.Integer) and fmt == 'csv':
+        convert = int
+    process = column.type.dialect_impl(dialect).bind_processor(dialect)
+    if process is not None and isinstance(column.type, sa.DateTime):
+        # SQLite stores datetimes as text; when its format is plain ISO 8601
+        # let the C isoformat build it, which is several times faster
+        sample = datetime(2000, 1, 2, 3, 4, 5, 6)
+        if process(sample) == sample.isoformat(' ', 'microseconds'):
+            process = partial(datetime.isoformat, sep=' ',
+                              timespec='microseconds')
+    if convert is None and process is None and \
+            not (column.nullable and fmt == 'csv'):
+        return None
+
+    def decode(value):
+        # CSV has no null, so an empty cell means NULL for nullable columns
+        if value is None or (value == '' and column.nullable):
+            return None
+        if convert is not None:
+            value = convert(value)
+        return value if process is None else process(value)
+
+    def decode_column(values):
+        if None in values or (column.nullable and '' in values):
+            return map(decode, values)
+        # no NULLs, so the conversions can be mapped without a Python call
+        # per value
+        for function in (convert, process):
+            if function is not None:
+                values = map(function, values)
+        return values
+    return decode_column
+
+
+def _data_file(directory, name, fmt):
+    return os.path.join(directory, f'{name}.{fmt}')
+
+
+def _export_rows(name, batch_size):
+    """Stream the rows of a table in primary key order."""
+    table = _table(name)
+    query = sa.select(table).order_by(*table.primary_key.columns)
+    with db.engine.connect() as conn:
+        result = conn.execution_options(
+            stream_results=True, yield_per=batch_size).execute(query)
+        for row in result.mappings():
+            yield {key: _encode(value) for key, value in row.items()}
+
+
+def _read_batches(path, fmt, names, batch_size, skip=0):
+    """Yield (keys, rows) batches from a table file after skipping `skip`
+    rows. `keys` are the columns of `names` present in the file and each row
+    is a tuple of their values.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            reader = csv.reader(f)
+            header = next(reader, [])
+            keys = [name for name in names if name in header]
+            getter = itemgetter(*[header.index(key) for key in keys])
+            lines = islice(reader, skip, None)
+        else:
+            keys = getter = None
+            lines = islice((line for line in f if line.strip()), skip, None)
+        while True:
+            batch = list(islice(lines, batch_size))
+            if not batch:
+                break
+            if fmt != 'csv':
+                # one parse per batch instead of one per line
+                batch = json.loads('[' + ','.join(batch) + ']')
+                if keys is None:
+                    keys = [name for name in names if name in batch[0]]
+                    getter = itemgetter(*keys)
+            yield keys, list(map(getter, batch))
+
+
+def _load_checkpoint():
+    with db.engine.connect() as conn:
+        return dict(conn.execute(sa.select(
+            import_checkpoint.c.table_name, import_checkpoint.c.rows)).all())
+
+
+def _save_checkpoint(conn, name, rows):
+    conn.execute(import_checkpoint.delete().where(
+        import_checkpoint.c.table_name == name))
+    conn.execute(import_checkpoint.insert().values(table_name=name, rows=rows))
+
+
+def _clear_checkpoint():
+    with db.engine.begin() as conn:
+        conn.execute(import_checkpoint.delete())
+
+
+def _insert_rows(conn, table, keys, decoders, rows):
+    """Insert `rows` with a single executemany, bypassing per-row parameter
+    processing in SQLAlchemy. Decoding happens a column at a time."""
+    if decoders:
+        columns = list(zip(*rows))
+        for i, decode in decoders:
+            columns[i] = decode(columns[i])
+        rows = list(zip(*columns))
+    compiled = table.insert().compile(dialect=conn.dialect, column_keys=keys)
+    if conn.dialect.positional:
+        order = [keys.index(key) for key in compiled.positiontup]
+        if order != list(range(len(keys))):
+            rows = [tuple(row[i] for i in order) for row in rows]
+    else:
+        rows = [dict(zip(keys, row)) for row in rows]
+    conn.exec_driver_sql(compiled.string, rows)
+
+
+def _reset_sequence(conn, table):
+    """Move the id counter of `table` past the imported ids, including ids
+    of rows moved to the tables in ID_SHARERS, so none is handed out
+    again."""
+    if 'id' not in table.c:
+        return
+    max_id = max(conn.scalar(sa.select(sa.func.max(_table(name).c.id))) or 0
+                 for name in (table.name, *ID_SHARERS.get(table.name, ())))
+    if conn.dialect.name == 'postgresql':
+        conn.execute(sa.text(
+            "SELECT setval(pg_get_serial_sequence(:table, 'id'), :id, false)"),
+            {'table': f'"{table.name}"', 'id': max_id + 1})
+    elif conn.dialect.name == 'sqlite' and \
+            table.dialect_options['sqlite']['autoincrement']:
+        updated = conn.execute(sa.text(
+            'UPDATE sqlite_sequence SET seq = MAX(seq, :id) '
+            'WHERE name = :table'), {'table': table.name, 'id': max_id})
+        if not updated.rowcount:
+            conn.execute(sa.text(
+                'INSERT INTO sqlite_sequence (name, seq) VALUES (:table, :id)'),
+                {'table': table.name, 'id': max_id})
+
+
+def export_data(directory, fmt='ndjson', batch_size=5000, tables=TABLES):
+    """Write each table to its own file in `directory`, return row counts."""
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    for name in tables:
+        columns = [c.name for c in _table(name).columns]
+        count = 0
+        with open(_data_file(directory, name, fmt), 'w', newline='',
+                  encoding='utf-8') as f:
+            if fmt == 'csv':
+                writer = csv.DictWriter(f, fieldnames=columns)
+                writer.writeheader()
+                for row in _export_rows(name, batch_size):
+                    writer.writerow(row)
+                    count += 1
+            else:
+                for row in _export_rows(name, batch_size):
+                    f.write(json.dumps(row, separators=(',', ':')) + '\n')
+                    count += 1
+        counts[name] = count
+    return counts
+
+
+def import_data(directory, fmt='ndjson', batch_size=5000, tables=TABLES,
+                resume=True):
+    """Bulk load table files from `directory`, return rows inserted.
+
+    Rows are inserted with executemany in batches of `batch_size`, one
+    transaction per batch. Each batch also records the number of rows loaded
+    per table in the import_checkpoint table, so an interrupted import picks
+    up exactly where it stopped when run again. Tables are expected to be
+    empty when an import starts on them.
+    """
+    if not resume:
+        _clear_checkpoint()
+    checkpoint = _load_checkpoint()
+    counts = {}
+    for name in tables:
+        path = _data_file(directory, name, fmt)
+        if not os.path.exists(path):
+            continue
+        table = _table(name)
+        done = checkpoint.get(name, 0)
+        if not done:
+            with db.engine.connect() as conn:
+                if conn.scalar(sa.select(sa.exists().select_from(table))):
+                    raise click.ClickException(
+                        f'Table {name} already has rows and no import '
+                        f'checkpoint; import into an empty database')
+        counts[name] = 0
+        names = [c.name for c in table.columns]
+        decoders = None
+        for keys, rows in _read_batches(path, fmt, names, batch_size, done):
+            if decoders is None:
+                decoders = [(i, _decoder(table.c[key], fmt, db.engine.dialect))
+                            for i, key in enumerate(keys)]
+                decoders = [(i, decode) for i, decode in decoders if decode]
+            with db.engine.begin() as conn:
+                _insert_rows(conn, table, keys, decoders, rows)
+                done += len(rows)
+                _save_checkpoint(conn, name, done)
+            counts[name] += len(rows)
+    resets = set(counts) | {name for name, sharers in ID_SHARERS.items()
+                            if counts.keys() & set(sharers)}
+    with db.engine.begin() as conn:
+        for name in resets:
+            _reset_sequence(conn, _table(name))
+    _clear_checkpoint()
+    # summaries are derived data, so rebuild rather than import them
+    if counts.keys() & {'quest', 'quest_participants'}:
+        rebuild_stats()
+    if counts.keys() & {'post', 'post_users'}:
+        rebuild_trending()
+    return counts
+
+
+@app.cli.group()
+def data():
+    """Bulk import and export commands."""
+    pass
+
+
+@data.command('export')
+@click.argument('directory')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default='ndjson',
+              help='File format to write.')
+@click.option('--batch-size', default=5000, help='Rows fetched per round trip.')
+@click.option('--table', 'tables', multiple=True, type=click.Choice(TABLES),
+              help='Only export this table (can be repeated).')
+def export(directory, fmt, batch_size, tables):
+    """Export users, posts, quests, the follow graph and the post archive
+    to DIRECTORY."""
+    tables = [name for name in TABLES if name in tables] if tables else TABLES
+    for name, count in export_data(directory, fmt, batch_size,
+                                   tables).items():
+        click.echo(f'{name}: {count} rows exported')
+
+
+@data.command('import')
+@click.argument('directory')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default='ndjson',
+              help='File format to read.')
+@click.option('--batch-size', default=5000, help='Rows inserted per batch.')
+@click.option('--table', 'tables', multiple=True, type=click.Choice(TABLES),
+              help='Only import this table (can be repeated).')
+@click.option('--restart', is_flag=True,
+              help='Ignore any checkpoint left by an interrupted import.')
+def import_(directory, fmt, batch_size, tables, restart):
+    """Import users, posts, quests, the follow graph and the post archive
+    from DIRECTORY."""
+    tables = [name for name in TABLES if name in tables] if tables else TABLES
+    for name, count in import_data(directory, fmt, batch_size, tables,
+                                   resume=not restart).items():
+        click.echo(f'{name}: {count} rows imported')
+
+
+@app.cli.group()
+def quests():
+    """Quest leaderboard commands."""
+    pass
+
+
+@quests.command()
+def rebuild():
+    """Recompute the quest and participant summaries from quest joins."""
+    rebuild_stats()
+    click.echo('Rebuilt quest summaries')
+
+
+@app.cli.group()
+def suggestions():
+    """Who-to-follow suggestion commands."""
+    pass
+
+
+@suggestions.command()
+@click.option('--full', is_flag=True,
+              help='Recompute every user instead of only changed ones.')
+def update(full):
+    """Recompute stored who-to-follow suggestions.
+
+    Meant to run periodically; by default it only revisits users affected
+    by follows and post joins since the previous run.
+    """
+    count = update_suggestions(full=full)
+    click.echo(f'Updated suggestions for {count} users')
+
+
+@app.cli.group()
+def trending():
+    """Trending feed commands."""
+    pass
+
+
+@trending.command()
+@click.option('--rebuild', is_flag=True,
+              help='Recompute the window from post joins instead.')
+def refresh(rebuild):
+    """Rescore trending posts and drop those that left the window.
+
+    Meant to run periodically, as due date boosts change over time.
+    """
+    if rebuild:
+        count = rebuild_trending()
+        click.echo(f'Rebuilt trending window with {count} posts')
+    else:
+        rescored, evicted = refresh_trending()
+        click.echo(f'Rescored {rescored} trending posts, evicted {evicted}')
+
+
+@app.cli.group()
+def archive():
+    """Post archive commands."""
+    pass
+
+
+@archive.command()
+@click.option('--batch-size', type=int, help='Posts moved per transaction.')
+@click.option('--pause', default=0.0, help='Seconds to wait between batches.')
+@click.option('--max-batches', type=int, help='Stop after this many batches.')
+def run(batch_size, pause, max_batches):
+    """Move posts long past their due date to the archive tables."""
+    count = archive_posts(batch_size=batch_size, pause=pause,
+                          max_batches=max_batches)
+    click.echo(f'Archived {count} posts')
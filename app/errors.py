@@ -7,6 +7,13 @@ def not_found_error(error):
     return render_template('404.html'), 404
 
 
+@app.errorhandler(429)
+def too_many_requests_error(error):
+    headers = {'Retry-After': str(error.retry_after)} \
+        if error.retry_after else {}
+    return render_template('429.html', error=error), 429, headers
+
+
 @app.errorhandler(500)
 def internal_error(error):
     db.session.rollback()
@@ -4,7 +4,7 @@ from flask_wtf.file import FileField, FileAllowed
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, \
     TextAreaField, IntegerField
 from wtforms.validators import ValidationError, DataRequired, Email, EqualTo, \
-    Length, NumberRange, Optional
+    Length, NumberRange, Optional, InputRequired
 import sqlalchemy as sa
 from app import db
 from wtforms.fields import DateTimeLocalField
@@ -107,7 +107,10 @@ class QuestForm(FlaskForm):
         DataRequired(), Length(min=1, max=140)])
 
     progress = IntegerField('Progress', validators=[
-        DataRequired(), NumberRange(min=0, max=100)])
+        InputRequired(), NumberRange(min=0, max=100)])
+
+    deadline = DateTimeLocalField('Deadline', format='%Y-%m-%dT%H:%M',
+                                  validators=[Optional()])
 
     image = FileField(
         'Quest Image',
@@ -115,3 +118,9 @@ class QuestForm(FlaskForm):
     )
 
     submit = SubmitField('Create Quest')
+
+
+class QuestProgressForm(FlaskForm):
+    progress = IntegerField('Progress', validators=[
+        InputRequired(), NumberRange(min=0, max=100)])
+    submit = SubmitField('Update')
@@ -0,0 +1,113 @@
+import numpy as np
+import sqlalchemy as sa
+from app import db
+from app.models import User, followers, post_users
+
+
+def _load_pairs(query, batch_size=50000):
+    """Return the two-column result of `query` as an (n, 2) int array."""
+    result = db.session.execute(
+        query.execution_options(yield_per=batch_size))
+    chunks = [np.array(rows, dtype=np.int64).reshape(-1, 2)
+              for rows in result.partitions()]
+    if not chunks:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.concatenate(chunks)
+
+
+def _csr(src, dst, size):
+    """Build (indptr, indices) adjacency arrays for edges src -> dst."""
+    order = np.argsort(src, kind='stable')
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=size), out=indptr[1:])
+    return indptr, dst[order]
+
+
+def _neighbors(csr, nodes):
+    """Concatenate the adjacency lists of `nodes`, keeping duplicates."""
+    indptr, indices = csr
+    nodes = np.asarray(nodes, dtype=np.int64)
+    starts = indptr[nodes]
+    lengths = indptr[nodes + 1] - starts
+    total = lengths.sum()
+    if total == 0:
+        return indices[:0]
+    # positions of every neighbor: each list's start repeated over its
+    # length, plus the offset within the list
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return indices[offsets + np.arange(total)]
+
+
+class FollowGraph:
+    """Follow and post co-join graphs as compact CSR adjacency arrays.
+
+    Users and posts are renumbered densely; ``user_ids`` maps a node back to
+    its user id.
+    """
+    def __init__(self, user_ids, follows, joins):
+        self.user_ids = np.unique(np.asarray(user_ids, dtype=np.int64))
+        size = len(self.user_ids)
+        follows = follows[np.isin(follows[:, 0], self.user_ids) &
+                          np.isin(follows[:, 1], self.user_ids)]
+        joins = joins[np.isin(joins[:, 0], self.user_ids)]
+        src = self.nodes(follows[:, 0])
+        dst = self.nodes(follows[:, 1])
+        self.following = _csr(src, dst, size)
+        self.followers = _csr(dst, src, size)
+        post_ids, posts = np.unique(joins[:, 1], return_inverse=True)
+        users = self.nodes(joins[:, 0])
+        self.posts_joined = _csr(users, posts, size)
+        self.post_members = _csr(posts, users, len(post_ids))
+
+    @classmethod
+    def load(cls):
+        user_ids = db.session.scalars(sa.select(User.id)).all()
+        follows = _load_pairs(sa.select(followers.c.follower_id,
+                                        followers.c.followed_id))
+        joins = _load_pairs(sa.select(post_users.c.user_id,
+                                      post_users.c.post_id))
+        return cls(user_ids, follows, joins)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def nodes(self, user_ids):
+        """Map user ids to nodes, dropping ids that are not in the graph."""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        user_ids = user_ids[np.isin(user_ids, self.user_ids)]
+        return np.searchsorted(self.user_ids, user_ids)
+
+    def affected_by(self, nodes):
+        """Nodes whose suggestions depend on the edges of `nodes`."""
+        co_members = _neighbors(self.post_members,
+                                _neighbors(self.posts_joined, nodes))
+        return np.unique(np.concatenate([
+            nodes, _neighbors(self.followers, nodes), co_members]))
+
+    def suggest(self, node, limit, follow_weight=1.0, join_weight=0.5):
+        """Return up to `limit` (user id, score) pairs for a node.
+
+        Candidates score `follow_weight` for every followed user that
+        follows them and `join_weight` for every post they joined together
+        with the user.
+        """
+        followed = _neighbors(self.following, [node])
+        via_follows = _neighbors(self.following, followed)
+        via_posts = _neighbors(self.post_members,
+                               _neighbors(self.posts_joined, [node]))
+        candidates = np.concatenate([via_follows, via_posts])
+        if len(candidates) == 0:
+            return []
+        weights = np.concatenate([
+            np.full(len(via_follows), follow_weight),
+            np.full(len(via_posts), join_weight)])
+        candidates, inverse = np.unique(candidates, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+        keep = ~np.isin(candidates, followed) & (candidates != node)
+        candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            candidates, scores = candidates[top], scores[top]
+        order = np.lexsort((candidates, -scores))
+        return [(int(self.user_ids[c]), float(s))
+                for c, s in zip(candidates[order], scores[order])]
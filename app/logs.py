@@ -0,0 +1,188 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import SMTPHandler, RotatingFileHandler, QueueHandler, \
+    QueueListener
+from flask import g, request, has_request_context
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the request id, method, path and elapsed time to records.
+
+    This runs in the thread that logs, which is the only place the request
+    context is available; the fields then travel with the record.
+    """
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.path = request.path
+            start = g.get('request_start')
+            if start is not None:
+                record.elapsed_ms = round(
+                    (time.perf_counter() - start) * 1000, 3)
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+    fields = ('request_id', 'method', 'path', 'elapsed_ms')
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(
+                record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'location': f'{record.pathname}:{record.lineno}',
+            'process': record.process,
+        }
+        for field in self.fields:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class _RecordQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Resolve the message and traceback while still in the logging
+        # thread, but leave the formatting itself to the output handlers.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class ThrottledSMTPHandler(SMTPHandler):
+    """SMTPHandler that deduplicates and rate limits error emails.
+
+    A given error (same location, message and exception) is mailed at most
+    once per `window` seconds, and no more than `limit` emails go out per
+    window in total. The next email for an error notes how many identical
+    ones were dropped.
+    """
+    def __init__(self, *args, window=300, limit=5, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.window = window
+        self.limit = limit
+        self._window_start = 0.0
+        self._sent = 0
+        self._last_sent = {}
+        self._suppressed = {}
+
+    def _key(self, record):
+        exception = (record.exc_text or '').strip().rsplit('\n', 1)[-1]
+        return (record.pathname, record.lineno, record.getMessage(),
+                exception)
+
+    def emit(self, record):
+        now = time.monotonic()
+        if now - self._window_start >= self.window:
+            self._window_start = now
+            self._sent = 0
+            self._last_sent = {key: sent for key, sent
+                               in self._last_sent.items()
+                               if now - sent < self.window}
+        key = self._key(record)
+        if self._sent >= self.limit or key in self._last_sent:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return
+        self._last_sent[key] = now
+        self._sent += 1
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record = copy.copy(record)
+            record.msg = (f'{record.msg}\n\n'
+                          f'({suppressed} identical errors were not mailed)')
+        super().emit(record)
+
+
+class LogPipeline:
+    """Feed records through a queue to handlers running in a thread.
+
+    Request threads only put records on the queue; file writes, rotation
+    and email happen in the listener thread. A forked child (such as a
+    gunicorn worker forked from a preloading master) does not inherit the
+    listener thread, so it gets a fresh queue and listener of its own.
+    """
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.handler = _RecordQueueHandler(None)
+        self.handler.addFilter(RequestContextFilter())
+        self.listener = None
+        self.start()
+        os.register_at_fork(after_in_child=self.start)
+        atexit.register(self.stop)
+
+    def start(self):
+        self.handler.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.handler.queue, *self.handlers,
+                                      respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener and self.listener._thread:
+            self.listener.stop()
+
+
+def setup_logging(app):
+    handlers = []
+    if app.config['MAIL_SERVER']:
+        auth = None
+        if app.config['MAIL_USERNAME'] or app.config['MAIL_PASSWORD']:
+            auth = (app.config['MAIL_USERNAME'], app.config['MAIL_PASSWORD'])
+        secure = None
+        if app.config['MAIL_USE_TLS']:
+            secure = ()
+        mail_handler = ThrottledSMTPHandler(
+            mailhost=(app.config['MAIL_SERVER'], app.config['MAIL_PORT']),
+            fromaddr='no-reply@' + app.config['MAIL_SERVER'],
+            toaddrs=app.config['ADMINS'], subject='Microblog Failure',
+            credentials=auth, secure=secure,
+            window=app.config['LOG_MAIL_WINDOW'],
+            limit=app.config['LOG_MAIL_LIMIT'])
+        mail_handler.setLevel(logging.ERROR)
+        handlers.append(mail_handler)
+
+    if not os.path.exists('logs'):
+        os.mkdir('logs')
+    file_handler = RotatingFileHandler(
+        'logs/microblog.log', maxBytes=app.config['LOG_MAX_BYTES'],
+        backupCount=app.config['LOG_BACKUP_COUNT'])
+    file_handler.setFormatter(JSONFormatter())
+    file_handler.setLevel(logging.INFO)
+    handlers.append(file_handler)
+
+    pipeline = LogPipeline(handlers)
+    app.logger.addHandler(pipeline.handler)
+    app.logger.setLevel(logging.INFO)
+
+    @app.before_request
+    def start_request_log():
+        g.request_id = request.headers.get('X-Request-ID', '')[:64] or \
+            uuid.uuid4().hex
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def add_request_id(response):
+        if 'request_id' in g:
+            response.headers['X-Request-ID'] = g.request_id
+        return response
+
+    return pipeline
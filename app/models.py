@@ -1,12 +1,12 @@
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from hashlib import md5
+import secrets
 from time import time
 from typing import Optional
 import sqlalchemy as sa
 import sqlalchemy.orm as so
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-import jwt
 from app import app, db, login
 
 # Association table for followers
@@ -22,7 +22,8 @@ quest_participants = db.Table(
     'quest_participants',
     db.metadata,
     sa.Column('user_id', sa.Integer, sa.ForeignKey('user.id'), primary_key=True),
-    sa.Column('quest_id', sa.Integer, sa.ForeignKey('quest.id'), primary_key=True)
+    sa.Column('quest_id', sa.Integer, sa.ForeignKey('quest.id'), primary_key=True),
+    sa.Column('timestamp', sa.DateTime, default=lambda: datetime.now(timezone.utc))
 )
 
 # Association table for post participants (e.g., tagged users)
@@ -30,7 +31,9 @@ post_users = db.Table(
     'post_users',
     db.metadata,
     sa.Column('user_id', sa.Integer, sa.ForeignKey('user.id'), primary_key=True),
-    sa.Column('post_id', sa.Integer, sa.ForeignKey('post.id'), primary_key=True)
+    sa.Column('post_id', sa.Integer, sa.ForeignKey('post.id'), primary_key=True),
+    sa.Column('timestamp', sa.DateTime, index=True,
+              default=lambda: datetime.now(timezone.utc))
 )
 
 class User(UserMixin, db.Model):
@@ -44,6 +47,9 @@ class User(UserMixin, db.Model):
     profile_pic: so.Mapped[str] = so.mapped_column(
         sa.String(128), nullable=False, default='default.jpg'
     )
+    token: so.Mapped[Optional[str]] = so.mapped_column(
+        sa.String(32), index=True, unique=True)
+    token_expiration: so.Mapped[Optional[datetime]]
 
     posts: so.WriteOnlyMapped['Post'] = so.relationship(back_populates='author')
     created_quests: so.WriteOnlyMapped['Quest'] = so.relationship(back_populates='creator')
@@ -78,10 +84,15 @@ class User(UserMixin, db.Model):
     def follow(self, user):
         if not self.is_following(user):
             self.following.add(user)
+            db.session.add(SuggestionRefresh(user_id=self.id))
+            db.session.execute(sa.delete(Suggestion).where(
+                Suggestion.user_id == self.id,
+                Suggestion.suggested_id == user.id))
 
     def unfollow(self, user):
         if self.is_following(user):
             self.following.remove(user)
+            db.session.add(SuggestionRefresh(user_id=self.id))
 
     def is_following(self, user):
         query = self.following.select().where(User.id == user.id)
@@ -108,6 +119,7 @@ class User(UserMixin, db.Model):
         )
 
     def get_reset_password_token(self, expires_in=600):
+        import jwt
         return jwt.encode(
             {'reset_password': self.id, 'exp': time() + expires_in},
             app.config['SECRET_KEY'], algorithm='HS256'
@@ -115,12 +127,35 @@ class User(UserMixin, db.Model):
 
     @staticmethod
     def verify_reset_password_token(token):
+        import jwt
         try:
             id = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])['reset_password']
         except Exception:
             return
         return db.session.get(User, id)
 
+    def get_token(self, expires_in=3600):
+        now = datetime.now(timezone.utc)
+        if self.token and self.token_expiration.replace(
+                tzinfo=timezone.utc) > now + timedelta(seconds=60):
+            return self.token
+        self.token = secrets.token_hex(16)
+        self.token_expiration = now + timedelta(seconds=expires_in)
+        db.session.add(self)
+        return self.token
+
+    def revoke_token(self):
+        self.token_expiration = datetime.now(timezone.utc) - timedelta(
+            seconds=1)
+
+    @staticmethod
+    def check_token(token):
+        user = db.session.scalar(sa.select(User).where(User.token == token))
+        if user is None or user.token_expiration.replace(
+                tzinfo=timezone.utc) < datetime.now(timezone.utc):
+            return None
+        return user
+
 
 @login.user_loader
 def load_user(id):
@@ -128,6 +163,9 @@ def load_user(id):
 
 
 class Post(db.Model):
+    # archived posts keep their ids, so SQLite must never hand them out again
+    __table_args__ = {'sqlite_autoincrement': True}
+
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     title: so.Mapped[str] = so.mapped_column(sa.String(140))
     body: so.Mapped[str] = so.mapped_column(sa.String(140))
@@ -140,12 +178,45 @@ class Post(db.Model):
     users = db.relationship('User', secondary=post_users, backref='tagged_posts')
 
     image_file: so.Mapped[Optional[str]] = so.mapped_column(sa.String(128), nullable=True)
-    due_date = db.Column(db.DateTime, nullable=True)
+    due_date = db.Column(db.DateTime, nullable=True, index=True)
+
+    archived = False
 
     def __repr__(self):
         return f'<Post {self.body}>'
 
 
+# Archive of posts long past their due date, moved out of the post table by
+# app.archive so that the live timelines only scan current posts.
+post_users_archive = db.Table(
+    'post_users_archive',
+    db.metadata,
+    sa.Column('user_id', sa.Integer, sa.ForeignKey('user.id'), primary_key=True),
+    sa.Column('post_id', sa.Integer, sa.ForeignKey('post_archive.id'), primary_key=True),
+    sa.Column('timestamp', sa.DateTime)
+)
+
+
+class ArchivedPost(db.Model):
+    __tablename__ = 'post_archive'
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True, autoincrement=False)
+    title: so.Mapped[str] = so.mapped_column(sa.String(140))
+    body: so.Mapped[str] = so.mapped_column(sa.String(140))
+    timestamp: so.Mapped[datetime] = so.mapped_column(index=True)
+    user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id), index=True)
+    image_file: so.Mapped[Optional[str]] = so.mapped_column(sa.String(128), nullable=True)
+    due_date = db.Column(db.DateTime, nullable=True)
+
+    author: so.Mapped[User] = so.relationship()
+    users = db.relationship('User', secondary=post_users_archive, viewonly=True)
+
+    archived = True
+
+    def __repr__(self):
+        return f'<ArchivedPost {self.body}>'
+
+
 class Quest(db.Model):
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     title: so.Mapped[str] = so.mapped_column(sa.String(140), nullable=False)
@@ -159,8 +230,113 @@ class Quest(db.Model):
 
     creator: so.Mapped[User] = so.relationship(back_populates='created_quests')
     participants = db.relationship('User', secondary=quest_participants, back_populates='joined_quests')
+    stats: so.Mapped[Optional['QuestStats']] = so.relationship(
+        back_populates='quest', cascade='all, delete-orphan')
 
     image_file: so.Mapped[Optional[str]] = so.mapped_column(sa.String(128), nullable=True)
 
     def __repr__(self):
         return f'<Quest {self.title}>'
+
+    def is_participant(self, user):
+        query = sa.select(quest_participants).where(
+            quest_participants.c.quest_id == self.id,
+            quest_participants.c.user_id == user.id)
+        return db.session.execute(query).first() is not None
+
+
+# Summary tables for the quest leaderboards. They are kept up to date by
+# app.quests as quests are created, joined and progressed, so that ranking
+# reads a few index entries instead of aggregating quest_participants.
+class QuestStats(db.Model):
+    __table_args__ = (
+        sa.Index('ix_quest_stats_participants', 'participant_count', 'quest_id'),
+        sa.Index('ix_quest_stats_recent', 'join_score', 'quest_id'),
+        sa.Index('ix_quest_stats_progress', 'progress', 'quest_id'),
+    )
+
+    quest_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey(Quest.id), primary_key=True)
+    participant_count: so.Mapped[int] = so.mapped_column(default=0)
+    # log-space decayed join count, see app.utils.decay_score()
+    join_score: so.Mapped[float] = so.mapped_column(default=0.0)
+    progress: so.Mapped[int] = so.mapped_column(default=0)
+
+    quest: so.Mapped[Quest] = so.relationship(back_populates='stats')
+
+    def __repr__(self):
+        return f'<QuestStats {self.quest_id}>'
+
+
+class ParticipantStats(db.Model):
+    __table_args__ = (
+        sa.Index('ix_participant_stats_rank',
+                 'quests_completed', 'quests_joined', 'user_id'),
+    )
+
+    user_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey(User.id), primary_key=True)
+    quests_joined: so.Mapped[int] = so.mapped_column(default=0)
+    quests_completed: so.Mapped[int] = so.mapped_column(default=0)
+
+    user: so.Mapped[User] = so.relationship()
+
+    def __repr__(self):
+        return f'<ParticipantStats {self.user_id}>'
+
+
+# Rolling window of recently joined posts, ranked for the trending feed by
+# app.trending. Posts leave the window when they stop being joined or
+# their due date passes.
+class PostTrend(db.Model):
+    __table_args__ = (
+        sa.Index('ix_post_trend_rank', 'score', 'post_id'),
+    )
+
+    post_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey(Post.id), primary_key=True)
+    # log-space decayed join count, see app.utils.decay_score()
+    join_score: so.Mapped[float] = so.mapped_column(default=0.0)
+    last_join: so.Mapped[datetime] = so.mapped_column(index=True)
+    due_date: so.Mapped[Optional[datetime]]
+    score: so.Mapped[float]
+
+    def __repr__(self):
+        return f'<PostTrend {self.post_id}>'
+
+
+# Precomputed "who to follow" suggestions, written by app.recommendations.
+class Suggestion(db.Model):
+    __table_args__ = (
+        sa.Index('ix_suggestion_rank', 'user_id', 'score'),
+    )
+
+    user_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey(User.id), primary_key=True)
+    suggested_id: so.Mapped[int] = so.mapped_column(
+        sa.ForeignKey(User.id), primary_key=True)
+    score: so.Mapped[float]
+
+    suggested: so.Mapped[User] = so.relationship(foreign_keys=[suggested_id])
+
+    def __repr__(self):
+        return f'<Suggestion {self.user_id} -> {self.suggested_id}>'
+
+
+# Users whose follows or post joins changed since suggestions were built.
+class SuggestionRefresh(db.Model):
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id))
+
+    def __repr__(self):
+        return f'<SuggestionRefresh {self.user_id}>'
+
+
+# Rows loaded per table by an interrupted `flask data import`. Written in the
+# same transaction as each batch, so it always matches what was committed.
+import_checkpoint = db.Table(
+    'import_checkpoint',
+    db.metadata,
+    sa.Column('table_name', sa.String(64), primary_key=True),
+    sa.Column('rows', sa.Integer, nullable=False)
+)
@@ -0,0 +1,200 @@
+from datetime import datetime, timedelta, timezone
+import sqlalchemy as sa
+from app import app, db
+from app.models import User, Quest, QuestStats, ParticipantStats, \
+    quest_participants
+from app.utils import decay_score, decayed_count, upsert
+
+# Progress at which a quest counts as completed.
+COMPLETE = 100
+
+LEADERBOARDS = {
+    'participants': QuestStats.participant_count,
+    'recent': QuestStats.join_score,
+    'completion': QuestStats.progress,
+}
+
+
+def join_half_life():
+    return timedelta(days=app.config['QUEST_JOIN_HALF_LIFE_DAYS'])
+
+
+def _completed():
+    return sa.case((Quest.progress >= COMPLETE, 1), else_=0)
+
+
+def _quest_stats(quest):
+    """Return the summary row of `quest`, locked until the end of the
+    transaction so that concurrent joins update it one after another."""
+    if quest.id is None:
+        if quest.stats is None:
+            quest.stats = QuestStats(participant_count=0, join_score=0.0,
+                                     progress=quest.progress or 0)
+        return quest.stats
+    if db.session.get(QuestStats, quest.id) is None:
+        # a quest joined before its summary row existed starts from its
+        # joins; if another request creates the row first, theirs is kept
+        joins = db.session.scalars(
+            sa.select(quest_participants.c.timestamp)
+            .where(quest_participants.c.quest_id == quest.id)).all()
+        join_score = 0.0
+        half_life = join_half_life()
+        for when in joins:
+            if when is not None:
+                join_score = decay_score(join_score, when, half_life)
+        db.session.execute(upsert(QuestStats.__table__, {
+            'quest_id': quest.id, 'participant_count': len(joins),
+            'join_score': join_score, 'progress': quest.progress or 0,
+        }, ['quest_id']))
+    return db.session.get(QuestStats, quest.id, with_for_update=True,
+                          populate_existing=True)
+
+
+def _participant_stats(user):
+    if db.session.get(ParticipantStats, user.id) is None:
+        joined, completed = db.session.execute(
+            sa.select(sa.func.count(),
+                      sa.func.coalesce(sa.func.sum(_completed()), 0))
+            .select_from(quest_participants)
+            .join(Quest, Quest.id == quest_participants.c.quest_id)
+            .where(quest_participants.c.user_id == user.id)).one()
+        db.session.execute(upsert(ParticipantStats.__table__, {
+            'user_id': user.id, 'quests_joined': joined,
+            'quests_completed': completed,
+        }, ['user_id']))
+    return db.session.get(ParticipantStats, user.id)
+
+
+def _increment(stats, attr, delta):
+    # pending rows hold plain numbers, stored rows get an atomic UPDATE
+    if stats in db.session.new:
+        setattr(stats, attr, getattr(stats, attr) + delta)
+    else:
+        setattr(stats, attr, getattr(type(stats), attr) + delta)
+
+
+def create_quest(quest):
+    """Add a new quest to the session along with its summary row."""
+    db.session.add(quest)
+    _quest_stats(quest)
+
+
+def join_quest(quest, user, when=None):
+    """Make `user` a participant of `quest`, updating the summaries.
+
+    Returns False, without changing anything, if the user had already
+    joined.
+    """
+    if quest.is_participant(user):
+        return False
+    when = when or datetime.now(timezone.utc)
+    # summaries missing their row are built from the joins made so far, so
+    # look them up before adding this one; the quest row stays locked until
+    # commit, as its join score is updated in Python
+    stats = _quest_stats(quest)
+    user_stats = _participant_stats(user)
+    db.session.execute(quest_participants.insert().values(
+        user_id=user.id, quest_id=quest.id, timestamp=when))
+
+    _increment(stats, 'participant_count', 1)
+    stats.join_score = decay_score(stats.join_score, when, join_half_life())
+
+    _increment(user_stats, 'quests_joined', 1)
+    if quest.progress >= COMPLETE:
+        _increment(user_stats, 'quests_completed', 1)
+    return True
+
+
+def set_progress(quest, progress):
+    """Change the progress of `quest`, updating the summaries.
+
+    Crossing the completion mark in either direction adjusts the completed
+    count of every participant with a single UPDATE.
+    """
+    was_complete = quest.progress >= COMPLETE
+    quest.progress = progress
+    _quest_stats(quest).progress = progress
+    is_complete = progress >= COMPLETE
+    if was_complete != is_complete:
+        participants = sa.select(quest_participants.c.user_id).where(
+            quest_participants.c.quest_id == quest.id)
+        db.session.execute(
+            sa.update(ParticipantStats)
+            .where(ParticipantStats.user_id.in_(participants))
+            .values(quests_completed=ParticipantStats.quests_completed +
+                    (1 if is_complete else -1)))
+
+
+def recent_joins(stats, now=None):
+    """Return the decayed number of recent joins for a QuestStats row."""
+    return decayed_count(stats.join_score,
+                         now or datetime.now(timezone.utc), join_half_life())
+
+
+def leaderboard(kind, limit):
+    """Return the top `limit` (quest, stats) pairs for a leaderboard kind."""
+    column = LEADERBOARDS[kind]
+    query = (
+        sa.select(Quest, QuestStats)
+        .join(QuestStats)
+        .order_by(column.desc(), QuestStats.quest_id.desc())
+        .limit(limit)
+    )
+    return db.session.execute(query).all()
+
+
+def top_participants(limit):
+    """Return the top `limit` (user, stats) pairs by quests completed."""
+    query = (
+        sa.select(User, ParticipantStats)
+        .join(ParticipantStats)
+        .order_by(ParticipantStats.quests_completed.desc(),
+                  ParticipantStats.quests_joined.desc(),
+                  ParticipantStats.user_id.desc())
+        .limit(limit)
+    )
+    return db.session.execute(query).all()
+
+
+def rebuild_stats():
+    """Recompute all quest summaries from scratch.
+
+    Only needed when quest data is written behind the back of this module,
+    such as by a bulk import or before the summaries existed.
+    """
+    db.session.execute(sa.delete(QuestStats))
+    db.session.execute(sa.delete(ParticipantStats))
+
+    joins = (
+        sa.select(Quest.id, sa.func.count(quest_participants.c.user_id),
+                  sa.literal(0.0), Quest.progress)
+        .outerjoin(quest_participants)
+        .group_by(Quest.id, Quest.progress)
+    )
+    db.session.execute(sa.insert(QuestStats).from_select(
+        ['quest_id', 'participant_count', 'join_score', 'progress'], joins))
+
+    # join scores depend on each join time, so they are folded in Python
+    scores = {}
+    half_life = join_half_life()
+    rows = db.session.execute(
+        sa.select(quest_participants.c.quest_id,
+                  quest_participants.c.timestamp)
+        .where(quest_participants.c.timestamp.is_not(None))
+        .execution_options(yield_per=5000))
+    for quest_id, when in rows:
+        scores[quest_id] = decay_score(scores.get(quest_id), when, half_life)
+    if scores:
+        db.session.execute(sa.update(QuestStats), [
+            {'quest_id': quest_id, 'join_score': score}
+            for quest_id, score in scores.items()])
+
+    totals = (
+        sa.select(quest_participants.c.user_id, sa.func.count(),
+                  sa.func.sum(_completed()))
+        .join(Quest, Quest.id == quest_participants.c.quest_id)
+        .group_by(quest_participants.c.user_id)
+    )
+    db.session.execute(sa.insert(ParticipantStats).from_select(
+        ['user_id', 'quests_joined', 'quests_completed'], totals))
+    db.session.commit()
@@ -0,0 +1,145 @@
+import math
+from collections import OrderedDict
+import threading
+import time
+from functools import wraps
+from flask import request
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+from app import app
+
+
+class MemoryStore:
+    """Token buckets held in this process.
+
+    Each gunicorn worker gets its own buckets, so with several workers the
+    effective limit is multiplied; use a Redis store to share them. Past
+    `max_keys` buckets the least recently used one is dropped, which at
+    worst gives a long idle client a full bucket again.
+    """
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity, now=None):
+        """Take a token from the bucket at `key`.
+
+        The bucket holds up to `capacity` tokens and refills at `rate`
+        tokens per second. Returns 0 if a token was taken, or else the
+        number of seconds until one will be available.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            # popped and put back so the bucket moves to the recent end
+            tokens, last = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisStore:
+    """Token buckets shared through Redis, or any server speaking its
+    protocol and running Lua scripts.
+
+    Each check is a single script call, so it is atomic and costs one
+    round trip, and it uses the server clock so that app servers agree.
+    """
+    script = '''
+        local rate = tonumber(ARGV[1])
+        local capacity = tonumber(ARGV[2])
+        local clock = redis.call('TIME')
+        local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(bucket[1]) or capacity
+        local last = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - last) * rate)
+        local wait = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            wait = (1 - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens),
+                   'ts', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+        return tostring(wait)
+    '''
+
+    def __init__(self, url, prefix='ratelimit:'):
+        import redis
+        self.errors = redis.exceptions.RedisError
+        self.prefix = prefix
+        self._take = redis.Redis.from_url(url).register_script(self.script)
+
+    def take(self, key, rate, capacity, now=None):
+        try:
+            return float(self._take(keys=[self.prefix + key],
+                                    args=[rate, capacity]))
+        except self.errors:
+            # an unreachable limiter should not take the site down with it
+            app.logger.warning('Rate limit store unavailable', exc_info=True)
+            return 0.0
+
+
+class RateLimiter:
+    def __init__(self):
+        self._store = None
+
+    @property
+    def store(self):
+        # created on first use, so each forked worker connects on its own
+        if self._store is None:
+            url = app.config['RATELIMIT_STORAGE_URL']
+            self._store = RedisStore(url) if url else MemoryStore()
+        return self._store
+
+    def check(self, scope):
+        """Take a token for `scope` from the user's and the client IP's
+        buckets, raising TooManyRequests if either is empty.
+
+        The user's bucket goes first and a rejection stops there, so a user
+        retrying past their own limit does not drain the bucket they share
+        with everyone else behind the same address. The client IP is only
+        right behind a reverse proxy when PROXY_COUNT is set, see Config.
+        """
+        checks = []
+        if current_user.is_authenticated:
+            checks.append(('user', current_user.id,
+                           app.config['RATELIMIT_USER'].get(scope)))
+        checks.append(('ip', request.remote_addr,
+                       app.config['RATELIMIT_IP'].get(scope)))
+        for kind, who, limit in checks:
+            if limit is None:
+                continue
+            count, period = limit
+            wait = self.store.take(f'{scope}:{kind}:{who}', count / period,
+                                   count)
+            if wait:
+                raise TooManyRequests(retry_after=math.ceil(wait))
+
+
+limiter = RateLimiter()
+
+
+def rate_limit(scope):
+    """Limit writes to a view with the buckets configured for `scope`.
+
+    Only state-changing requests are counted, so rendering a form is free.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if app.config['RATELIMIT_ENABLED'] and \
+                    request.method not in ('GET', 'HEAD', 'OPTIONS'):
+                limiter.check(scope)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
@@ -0,0 +1,64 @@
+import sqlalchemy as sa
+from app import app, db
+from app.models import User, Suggestion, SuggestionRefresh
+
+
+def update_suggestions(full=False, batch_size=5000):
+    """Recompute stored suggestions and return how many users were updated.
+
+    By default only users affected by follows, unfollows and post joins
+    recorded since the last run are recomputed; `full` recomputes everyone.
+    """
+    # numpy is slow to import and only needed here, never to serve a page
+    import numpy as np
+    from app.graph import FollowGraph
+
+    last_refresh = db.session.scalar(sa.select(sa.func.max(
+        SuggestionRefresh.id)))
+    graph = FollowGraph.load()
+    if full:
+        nodes = np.arange(len(graph))
+        db.session.execute(sa.delete(Suggestion))
+    else:
+        changed = db.session.scalars(
+            sa.select(SuggestionRefresh.user_id).distinct()
+            .where(SuggestionRefresh.id <= (last_refresh or 0))).all()
+        nodes = graph.affected_by(graph.nodes(changed))
+        user_ids = graph.user_ids[nodes].tolist()
+        for i in range(0, len(user_ids), batch_size):
+            db.session.execute(sa.delete(Suggestion).where(
+                Suggestion.user_id.in_(user_ids[i:i + batch_size])))
+
+    limit = app.config['SUGGESTIONS_PER_USER']
+    follow_weight = app.config['SUGGESTION_FOLLOW_WEIGHT']
+    join_weight = app.config['SUGGESTION_JOIN_WEIGHT']
+    rows = []
+    for node in nodes:
+        user_id = int(graph.user_ids[node])
+        rows.extend({'user_id': user_id, 'suggested_id': suggested_id,
+                     'score': score}
+                    for suggested_id, score in graph.suggest(
+                        node, limit, follow_weight, join_weight))
+        if len(rows) >= batch_size:
+            db.session.execute(sa.insert(Suggestion), rows)
+            rows = []
+    if rows:
+        db.session.execute(sa.insert(Suggestion), rows)
+
+    if last_refresh is not None:
+        db.session.execute(sa.delete(SuggestionRefresh).where(
+            SuggestionRefresh.id <= last_refresh))
+    db.session.commit()
+    return len(nodes)
+
+
+def suggested_users(user, limit):
+    """Return the stored suggestions for `user` as (user, score) pairs."""
+    query = (
+        sa.select(User, Suggestion.score)
+        .join(Suggestion, Suggestion.suggested_id == User.id)
+        .where(Suggestion.user_id == user.id)
+        .order_by(Suggestion.score.desc())
+        .limit(limit)
+    )
+    return db.session.execute(query).all()
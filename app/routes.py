@@ -6,10 +6,18 @@ import sqlalchemy as sa
 from app import app, db
 from app.forms import (
     LoginForm, RegistrationForm, EditProfileForm,
-    EmptyForm, PostForm, ResetPasswordRequestForm, ResetPasswordForm, UploadImageForm
+    EmptyForm, PostForm, ResetPasswordRequestForm, ResetPasswordForm, UploadImageForm,
+    QuestForm, QuestProgressForm
 )
-from app.models import User, Post, Quest, post_users
+from app.models import User, Post, Quest, SuggestionRefresh, post_users, \
+    quest_participants
 from app.email import send_password_reset_email
+from app.quests import LEADERBOARDS, create_quest, join_quest, set_progress, \
+    leaderboard, top_participants, recent_joins
+from app.recommendations import suggested_users
+from app.trending import record_join, trending_posts
+from app.archive import user_posts_page
+from app.ratelimit import rate_limit
 
 from app.utils import save_image, allowed_file, delete_old_image
 
@@ -36,12 +44,14 @@ def index():
 
     return render_template(
         'index.html', title='Home',
-        posts=posts.items, now=datetime.utcnow(), next_url=next_url, prev_url=prev_url
+        posts=posts.items, now=datetime.utcnow(), next_url=next_url, prev_url=prev_url,
+        suggestions=suggested_users(current_user, app.config['SUGGESTIONS_PER_USER'])
     )
 
 
 @app.route('/create', methods=['GET', 'POST'])
 @login_required
+@rate_limit('create')
 def create():
     form = PostForm()
     if form.validate_on_submit():
@@ -84,6 +94,19 @@ def explore():
     )
 
 
+@app.route('/trending')
+@login_required
+def trending():
+    page = request.args.get('page', 1, type=int)
+    posts, has_next = trending_posts(max(page, 1), app.config['POSTS_PER_PAGE'])
+    next_url = url_for('trending', page=page + 1) if has_next else None
+    prev_url = url_for('trending', page=page - 1) if page > 1 else None
+    return render_template(
+        'index.html', title='Trending',
+        posts=posts, now=datetime.utcnow(), next_url=next_url, prev_url=prev_url
+    )
+
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
@@ -164,11 +187,8 @@ def reset_password(token):
 @login_required
 def user(username):
     user = db.first_or_404(sa.select(User).where(User.username == username))
-    page = request.args.get('page', 1, type=int)
-    query = user.posts.select().order_by(Post.timestamp.desc())
-    posts = db.paginate(query, page=page,
-                        per_page=app.config['POSTS_PER_PAGE'],
-                        error_out=False)
+    page = max(request.args.get('page', 1, type=int), 1)
+    posts, has_next = user_posts_page(user, page, app.config['POSTS_PER_PAGE'])
 
     joined_query = (
         sa.select(Post)
@@ -178,20 +198,24 @@ def user(username):
     )
     joined_posts = db.session.execute(joined_query).scalars().all()
 
-    next_url = url_for('user', username=user.username, page=posts.next_num) \
-        if posts.has_next else None
-    prev_url = url_for('user', username=user.username, page=posts.prev_num) \
-        if posts.has_prev else None
+    next_url = url_for('user', username=user.username, page=page + 1) \
+        if has_next else None
+    prev_url = url_for('user', username=user.username, page=page - 1) \
+        if page > 1 else None
     form = EmptyForm()
+    suggestions = None
+    if user == current_user:
+        suggestions = suggested_users(user, app.config['SUGGESTIONS_PER_USER'])
     return render_template(
-        'user.html', user=user, posts=posts.items, now=datetime.utcnow(),
+        'user.html', user=user, posts=posts, now=datetime.utcnow(),
         next_url=next_url, prev_url=prev_url,
-        form=form, joined_posts=joined_posts
+        form=form, joined_posts=joined_posts, suggestions=suggestions
     )
 
 
 @app.route('/edit_profile', methods=['GET', 'POST'])
 @login_required
+@rate_limit('upload')
 def edit_profile():
     form = EditProfileForm(current_user.username)
     if form.validate_on_submit():
@@ -218,6 +242,7 @@ def edit_profile():
 
 @app.route('/follow/<username>', methods=['POST'])
 @login_required
+@rate_limit('follow')
 def follow(username):
     form = EmptyForm()
     if form.validate_on_submit():
@@ -240,6 +265,7 @@ def follow(username):
 
 @app.route('/unfollow/<username>', methods=['POST'])
 @login_required
+@rate_limit('follow')
 def unfollow(username):
     form = EmptyForm()
     if form.validate_on_submit():
@@ -262,18 +288,116 @@ def unfollow(username):
 
 @app.route('/join_post/<int:post_id>', methods=['POST'])
 @login_required
+@rate_limit('join')
 def join_post(post_id):
     post = Post.query.get_or_404(post_id)
     if current_user != post.author and current_user not in post.users:
         post.users.append(current_user)
+        record_join(post)
+        db.session.add(SuggestionRefresh(user_id=current_user.id))
         db.session.commit()
         flash('You joined the post!')
     return redirect(request.referrer or url_for('index'))
 
 
+@app.route('/quests')
+@login_required
+def quests():
+    sort = request.args.get('sort', 'participants')
+    if sort not in LEADERBOARDS:
+        sort = 'participants'
+    size = app.config['QUEST_LEADERBOARD_SIZE']
+    return render_template(
+        'quests.html', title='Quests', sort=sort,
+        quests=leaderboard(sort, size), participants=top_participants(size),
+        recent_joins=recent_joins
+    )
+
+
+@app.route('/create_quest', methods=['GET', 'POST'])
+@login_required
+@rate_limit('create')
+def create_quest_view():
+    form = QuestForm()
+    if form.validate_on_submit():
+        quest = Quest(
+            title=form.title.data,
+            description=form.body.data,
+            progress=form.progress.data,
+            deadline=form.deadline.data,
+            creator=current_user
+        )
+        if form.image.data:
+            quest.image_file = save_image(
+                form.image.data,
+                folder='quest_pics',
+                size=(400, 400)
+            )
+        create_quest(quest)
+        db.session.commit()
+        flash('Your quest has been created!')
+        return redirect(url_for('quest_detail', quest_id=quest.id))
+
+    return render_template('create_quest.html', title='Create Quest', form=form)
+
+
+@app.route('/quest/<int:quest_id>')
+@login_required
+def quest_detail(quest_id):
+    quest = db.get_or_404(Quest, quest_id)
+    participants = db.session.scalars(
+        sa.select(User)
+        .join(quest_participants)
+        .where(quest_participants.c.quest_id == quest.id)
+        .order_by(quest_participants.c.timestamp.desc())
+        .limit(app.config['QUEST_LEADERBOARD_SIZE'])
+    ).all()
+    progress_form = None
+    if quest.creator == current_user:
+        progress_form = QuestProgressForm(progress=quest.progress)
+    return render_template(
+        'quest.html', title=quest.title, quest=quest,
+        participants=participants, form=EmptyForm(),
+        progress_form=progress_form,
+        is_participant=quest.is_participant(current_user),
+        recent_joins=recent_joins
+    )
+
+
+@app.route('/join_quest/<int:quest_id>', methods=['POST'])
+@login_required
+@rate_limit('join')
+def join_quest_view(quest_id):
+    form = EmptyForm()
+    if form.validate_on_submit():
+        quest = db.get_or_404(Quest, quest_id)
+        if join_quest(quest, current_user):
+            db.session.commit()
+            flash('You joined the quest!')
+        return redirect(url_for('quest_detail', quest_id=quest_id))
+    else:
+        return redirect(url_for('quests'))
+
+
+@app.route('/quest/<int:quest_id>/progress', methods=['POST'])
+@login_required
+def quest_progress(quest_id):
+    quest = db.get_or_404(Quest, quest_id)
+    if quest.creator != current_user:
+        flash('You are not authorized to update this quest.')
+        return redirect(url_for('quest_detail', quest_id=quest_id))
+    form = QuestProgressForm()
+    if form.validate_on_submit():
+        set_progress(quest, form.progress.data)
+        db.session.commit()
+        flash('Quest progress updated.')
+    return redirect(url_for('quest_detail', quest_id=quest_id))
+
+
 # Route to upload an image for a quest
 @app.route('/upload_quest_image/<int:quest_id>', methods=['GET', 'POST'])
 @login_required
+@rate_limit('upload')
 def upload_quest_image(quest_id):
     quest = Quest.query.get_or_404(quest_id)
     if quest.creator != current_user:
@@ -295,6 +419,7 @@ def upload_quest_image(quest_id):
 # Route to upload or update profile picture
 @app.route('/upload_profile_image', methods=['GET', 'POST'])
 @login_required
+@rate_limit('upload')
 def upload_profile_image():
     form = UploadImageForm()
     if form.validate_on_submit():
@@ -317,6 +442,7 @@ def upload_profile_image():
 # Route to upload an image for any generic post (not directly related to profile or quests)
 @app.route('/upload_post_image/<int:post_id>', methods=['GET', 'POST'])
 @login_required
+@rate_limit('upload')
 def upload_post_image(post_id):
     post = Post.query.get_or_404(post_id)
     if post.author != current_user:
@@ -0,0 +1,127 @@
+import math
+from datetime import datetime, timedelta, timezone
+import sqlalchemy as sa
+from app import app, db
+from app.models import Post, PostTrend, post_users
+from app.utils import decay_score, upsert
+
+
+def _settings():
+    return (
+        timedelta(hours=app.config['TRENDING_HALF_LIFE_HOURS']),
+        timedelta(days=app.config['TRENDING_WINDOW_DAYS']),
+        timedelta(days=app.config['TRENDING_DUE_HORIZON_DAYS']),
+        app.config['TRENDING_DUE_WEIGHT'],
+    )
+
+
+def _naive(when):
+    if when is not None and when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return when
+
+
+def trend_score(join_score, due_date, now):
+    """Combine a decayed join score with the closeness of the due date.
+
+    Both parts are in log space, so scores computed at different times
+    still rank correctly against each other. Returns None once the post is
+    past due, as it can no longer trend.
+    """
+    _, _, horizon, weight = _settings()
+    due_date, now = _naive(due_date), _naive(now)
+    if due_date is None or due_date - now >= horizon:
+        return join_score
+    if due_date <= now:
+        return None
+    closeness = 1 - (due_date - now) / horizon
+    return join_score + math.log1p(weight * closeness)
+
+
+def record_join(post, when=None):
+    """Count a join of `post` towards its trending score.
+
+    The post's row is created if missing and then locked until commit, so
+    concurrent joins fold their scores in one after another.
+    """
+    when = when or datetime.now(timezone.utc)
+    if trend_score(0.0, post.due_date, when) is None:
+        db.session.execute(sa.delete(PostTrend).where(
+            PostTrend.post_id == post.id))
+        return
+    db.session.execute(upsert(PostTrend.__table__, {
+        'post_id': post.id, 'join_score': 0.0, 'last_join': _naive(when),
+        'due_date': post.due_date, 'score': 0.0,
+    }, ['post_id']))
+    trend = db.session.get(PostTrend, post.id, with_for_update=True,
+                           populate_existing=True)
+    trend.join_score = decay_score(trend.join_score, when, _settings()[0])
+    trend.last_join = max(trend.last_join, _naive(when))
+    trend.due_date = post.due_date
+    trend.score = trend_score(trend.join_score, post.due_date, when)
+
+
+def refresh_trending(now=None):
+    """Rescore the posts in the trending window and evict stale ones.
+
+    Due date boosts grow as time passes, so this is meant to run
+    periodically. It only visits rows already in the window, never the
+    post table. Returns (rescored, evicted) counts.
+    """
+    now = _naive(now or datetime.now(timezone.utc))
+    window = _settings()[1]
+    stale = sa.or_(PostTrend.last_join < now - window,
+                   PostTrend.due_date <= now)
+    evicted = db.session.execute(sa.delete(PostTrend).where(stale)).rowcount
+    rows = db.session.execute(sa.select(
+        PostTrend.post_id, PostTrend.join_score, PostTrend.due_date)).all()
+    updates = [{'post_id': post_id,
+                'score': trend_score(join_score, due_date, now)}
+               for post_id, join_score, due_date in rows]
+    if updates:
+        db.session.execute(sa.update(PostTrend), updates)
+    db.session.commit()
+    return len(updates), evicted
+
+
+def rebuild_trending(now=None):
+    """Recompute the trending window from the joins in post_users."""
+    now = _naive(now or datetime.now(timezone.utc))
+    half_life, window, _, _ = _settings()
+    db.session.execute(sa.delete(PostTrend))
+    joins = db.session.execute(
+        sa.select(post_users.c.post_id, post_users.c.timestamp, Post.due_date)
+        .join(Post, Post.id == post_users.c.post_id)
+        .where(post_users.c.timestamp >= now - window)
+        .order_by(post_users.c.timestamp)
+        .execution_options(yield_per=5000))
+    trends = {}
+    for post_id, when, due_date in joins:
+        trend = trends.setdefault(post_id, {
+            'post_id': post_id, 'join_score': 0.0, 'due_date': due_date})
+        trend['join_score'] = decay_score(trend['join_score'], when,
+                                          half_life)
+        trend['last_join'] = when
+    rows = []
+    for trend in trends.values():
+        trend['score'] = trend_score(trend['join_score'], trend['due_date'],
+                                     now)
+        if trend['score'] is not None:
+            rows.append(trend)
+    if rows:
+        db.session.execute(sa.insert(PostTrend), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def trending_posts(page, per_page):
+    """Return a page of trending posts and whether another page follows."""
+    query = (
+        sa.select(Post)
+        .join(PostTrend)
+        .order_by(PostTrend.score.desc(), PostTrend.post_id.desc())
+        .offset((page - 1) * per_page)
+        .limit(per_page + 1)
+    )
+    posts = db.session.scalars(query).all()
+    return posts[:per_page], len(posts) > per_page
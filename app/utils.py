@@ -1,10 +1,16 @@
+import math
 import os
 import secrets
-from PIL import Image
+from datetime import datetime, timezone
+import sqlalchemy as sa
 from flask import current_app
+from app import db
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
+# Scores decayed with decay_score() are measured from this instant.
+DECAY_EPOCH = datetime(2020, 1, 1)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -15,6 +21,9 @@ def delete_old_image(image_path):
             os.remove(full_path)
 
 def save_image(form_image, folder, size=(200, 200)):
+    # Pillow is slow to import and only needed for uploads
+    from PIL import Image
+
     # generate random filename
     random_hex = secrets.token_hex(8)
     _, f_ext = os.path.splitext(form_image.filename)
@@ -32,3 +41,70 @@ def save_image(form_image, folder, size=(200, 200)):
 
     # return path relative to /static/uploads/
     return f"{folder}/{filename}"
+
+
+def precompile_templates():
+    """Compile every template into the Jinja cache of the current app."""
+    env = current_app.jinja_env
+    names = env.list_templates()
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def _naive_utc(when):
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return when
+
+
+def decay_score(score, when, half_life):
+    """Add an event at `when` to an exponentially decayed event count.
+
+    The count is stored as the log of its value at DECAY_EPOCH scaled
+    forward, so adding an event never has to touch the other events, and
+    comparing two scores compares their decayed counts at any common
+    instant. A score of 0 (or None) means no events.
+    """
+    rate = math.log(2) / half_life.total_seconds()
+    event = rate * (_naive_utc(when) - DECAY_EPOCH).total_seconds()
+    if not score:
+        return event
+    return max(score, event) + math.log1p(math.exp(-abs(score - event)))
+
+
+def decayed_count(score, now, half_life):
+    """Return the decayed event count a decay_score() value stands for."""
+    if not score:
+        return 0.0
+    rate = math.log(2) / half_life.total_seconds()
+    return math.exp(score - rate * (_naive_utc(now) - DECAY_EPOCH)
+                    .total_seconds())
+
+
+def upsert(table, values, key, update=None):
+    """Return an INSERT of `values` into `table` for when a row with the
+    same `key` columns may already exist.
+
+    Such a row is left alone, or if `update` is given, is changed to the
+    values of the dict `update(excluded)` returns, where `excluded` holds
+    the columns of the row that was not inserted. This lets concurrent
+    requests create the same summary row without either of them failing.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table).values(values)
+        if update is None:
+            return statement.on_duplicate_key_update(
+                {column: sa.column(column) for column in key})
+        return statement.on_duplicate_key_update(update(statement.inserted))
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    statement = insert(table).values(values)
+    if update is None:
+        return statement.on_conflict_do_nothing(index_elements=key)
+    return statement.on_conflict_do_update(
+        index_elements=key, set_=update(statement.excluded))
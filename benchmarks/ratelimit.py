@@ -0,0 +1,91 @@
+"""Measure the cost of the write rate limits.
+
+Times the token bucket store on its own, the full limiter check made for
+each limited request, and the same POST request served with and without
+@rate_limit through the test client. Run from the top-level directory:
+
+    python benchmarks/ratelimit.py [--requests 5000] [--redis-url URL]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import app  # noqa: E402
+from app.ratelimit import MemoryStore, RedisStore, limiter, \
+    rate_limit  # noqa: E402
+
+
+@app.route('/_bench/plain', methods=['POST'])
+def bench_plain():
+    return ''
+
+
+@app.route('/_bench/limited', methods=['POST'])
+@rate_limit('bench')
+def bench_limited():
+    return ''
+
+
+def time_store(store, count):
+    start = time.perf_counter()
+    for i in range(count):
+        store.take(f'bench:user:{i % 1000}', 1e9, 1e9)
+    return (time.perf_counter() - start) / count
+
+
+def time_check(count):
+    with app.test_request_context('/_bench/limited', method='POST'):
+        start = time.perf_counter()
+        for _ in range(count):
+            limiter.check('bench')
+        return (time.perf_counter() - start) / count
+
+
+def time_requests(client, count, rounds=10):
+    # alternate the two endpoints and keep the best round of each, so
+    # drift in the machine's speed affects both the same way
+    best = {'/_bench/plain': None, '/_bench/limited': None}
+    for _ in range(rounds):
+        for url in best:
+            start = time.perf_counter()
+            for _ in range(count // rounds):
+                client.post(url)
+            elapsed = (time.perf_counter() - start) / (count // rounds)
+            best[url] = elapsed if best[url] is None \
+                else min(best[url], elapsed)
+    return best['/_bench/plain'], best['/_bench/limited']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--redis-url',
+                        help='also measure a Redis store at this URL')
+    args = parser.parse_args()
+
+    stores = [('memory', MemoryStore())]
+    if args.redis_url:
+        stores.append(('redis', RedisStore(args.redis_url)))
+    app.config['RATELIMIT_IP'] = dict(app.config['RATELIMIT_IP'],
+                                      bench=(10 ** 9, 1))
+    client = app.test_client()
+
+    for name, store in stores:
+        per_take = time_store(store, args.requests)
+        limiter._store = store
+        per_check = time_check(args.requests)
+        plain, limited = time_requests(client, args.requests)
+        print(f'{name} store')
+        print(f'  bucket take:     {per_take * 1e6:8.2f} us')
+        print(f'  limiter check:   {per_check * 1e6:8.2f} us per request')
+        print(f'  request, plain:  {plain * 1e6:8.2f} us')
+        print(f'  request, limited:{limited * 1e6:8.2f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Measure application start-up cost.
+
+Each run starts a fresh interpreter, imports the application and serves
+one request through the test client, reporting the import time, the time
+to the first response, and whether the modules that should load lazily
+were imported. Run from the top-level directory:
+
+    python benchmarks/startup.py [--runs 10] [--precompile] [--path /login]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+basedir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+from microblog import app
+imported = time.perf_counter()
+if {precompile!r}:
+    from app.utils import precompile_templates
+    with app.app_context():
+        precompile_templates()
+ready = time.perf_counter()
+status = app.test_client().get({path!r}).status_code
+responded = time.perf_counter()
+print(json.dumps({{
+    'import': imported - start,
+    'precompile': ready - imported,
+    'first_response': responded - ready,
+    'status': status,
+    'lazy_loaded': sorted(m for m in ('PIL.Image', 'jwt', 'numpy')
+                          if m in sys.modules),
+}}))
+'''
+
+
+def run_once(precompile, path):
+    env = dict(os.environ, DATABASE_URL='sqlite://')
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD.format(precompile=precompile, path=path)],
+        cwd=basedir, env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--precompile', action='store_true',
+                        help='precompile templates before the first request')
+    parser.add_argument('--path', default='/login')
+    args = parser.parse_args()
+
+    results = [run_once(args.precompile, args.path) for _ in range(args.runs)]
+    print(f'{args.runs} runs, GET {args.path} -> {results[0]["status"]}')
+    for key in ('import', 'precompile', 'first_response'):
+        values = [result[key] * 1000 for result in results]
+        print(f'{key:>15}: median {statistics.median(values):7.1f} ms, '
+              f'min {min(values):7.1f} ms')
+    print(f'{"loaded eagerly":>15}: '
+          f'{", ".join(results[0]["lazy_loaded"]) or "none"}')
+
+
+if __name__ == '__main__':
+    main()
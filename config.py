@@ -12,4 +12,39 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     ADMINS = ['your-email@example.com']
+    LOG_MAX_BYTES = 10 * 1024 * 1024
+    LOG_BACKUP_COUNT = 10
+    LOG_MAIL_WINDOW = 300
+    LOG_MAIL_LIMIT = 5
     POSTS_PER_PAGE = 25
+    QUEST_LEADERBOARD_SIZE = 25
+    QUEST_JOIN_HALF_LIFE_DAYS = 7
+    SUGGESTIONS_PER_USER = 10
+    SUGGESTION_FOLLOW_WEIGHT = 1.0
+    SUGGESTION_JOIN_WEIGHT = 0.5
+    TRENDING_HALF_LIFE_HOURS = 24
+    TRENDING_WINDOW_DAYS = 7
+    TRENDING_DUE_HORIZON_DAYS = 7
+    TRENDING_DUE_WEIGHT = 1.0
+    ARCHIVE_AFTER_DAYS = 90
+    ARCHIVE_BATCH_SIZE = 500
+    # Number of reverse proxies in front of the app whose X-Forwarded-For
+    # and X-Forwarded-Proto headers are trusted. Behind a proxy this must be
+    # set, or every client shares the proxy's address (and IP rate limit).
+    PROXY_COUNT = int(os.environ.get('PROXY_COUNT') or 0)
+    # Write limits as (requests, seconds) per signed-in user and per client
+    # IP. Buckets live in each process unless a redis:// URL is given.
+    RATELIMIT_ENABLED = True
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL')
+    RATELIMIT_USER = {
+        'create': (10, 60),
+        'join': (30, 60),
+        'follow': (30, 60),
+        'upload': (5, 60),
+    }
+    RATELIMIT_IP = {
+        'create': (30, 60),
+        'join': (90, 60),
+        'follow': (90, 60),
+        'upload': (15, 60),
+    }
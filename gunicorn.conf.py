@@ -0,0 +1,34 @@
+# Production serving profile, picked up by boot.sh.
+#
+# The application is imported once in the master process (preload_app) and
+# the workers are forked from it, so modules, compiled templates and other
+# start-up state are shared copy-on-write instead of rebuilt per worker.
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', ':5000')
+workers = int(os.environ.get('GUNICORN_WORKERS') or
+              multiprocessing.cpu_count() * 2 + 1)
+preload_app = True
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    from app import app
+    from app.utils import precompile_templates
+    with app.app_context():
+        count = precompile_templates()
+    server.log.info('Precompiled %d templates', count)
+    # Move everything allocated so far out of the collector's view, so
+    # collections in the workers do not touch (and so copy) shared pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Pooled connections opened by the master must not be shared with the
+    # workers; each worker opens its own on first use.
+    from app import app, db
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -2,9 +2,30 @@ import os
 os.environ['DATABASE_URL'] = 'sqlite://'
 
 from datetime import datetime, timezone, timedelta
+import base64
+import json
+import logging
+import shutil
+import tempfile
 import unittest
+from unittest import mock
+import sqlalchemy as sa
+from flask import g
 from app import app, db
-from app.models import User, Post
+from click import ClickException
+from app.cli import export_data, import_data
+from app.logs import JSONFormatter, RequestContextFilter, ThrottledSMTPHandler
+from app.models import User, Post, Quest, QuestStats, ParticipantStats, \
+    ArchivedPost, PostTrend, post_users, post_users_archive, \
+    quest_participants, import_checkpoint
+from app.archive import archive_posts, user_posts_page
+from app.ratelimit import MemoryStore, limiter
+from app.recommendations import update_suggestions, suggested_users
+from app.utils import decay_score
+from app.trending import record_join, refresh_trending, rebuild_trending, \
+    trending_posts
+from app.quests import create_quest, join_quest, set_progress, leaderboard, \
+    top_participants, rebuild_stats
 
 
 class UserModelCase(unittest.TestCase):
@@ -30,6 +51,14 @@ class UserModelCase(unittest.TestCase):
                                          'd4c74594d841139328695756648b6bd6'
                                          '?d=identicon&s=128'))
 
+    def test_reset_password_token(self):
+        u = User(username='john', email='john@example.com')
+        db.session.add(u)
+        db.session.commit()
+        token = u.get_reset_password_token()
+        self.assertEqual(User.verify_reset_password_token(token), u)
+        self.assertIsNone(User.verify_reset_password_token(token + 'x'))
+
     def test_follow(self):
         u1 = User(username='john', email='john@example.com')
         u2 = User(username='susan', email='susan@example.com')
@@ -96,5 +125,620 @@ class UserModelCase(unittest.TestCase):
         self.assertEqual(f4, [p4])
 
 
+class DataTransferCase(unittest.TestCase):
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.directory = tempfile.mkdtemp()
+
+        u1 = User(username='john', email='john@example.com')
+        u2 = User(username='susan', email='susan@example.com')
+        db.session.add_all([u1, u2])
+        p1 = Post(title='hike', body='hike on sunday', author=u1,
+                  due_date=datetime(2030, 1, 1, 12, 0))
+        db.session.add(p1)
+        db.session.commit()
+        u1.follow(u2)
+        p1.users.append(u2)
+        db.session.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def reset_database(self):
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+
+    def assert_restored(self):
+        john = db.session.scalar(sa.select(User).where(User.username == 'john'))
+        susan = db.session.scalar(sa.select(User).where(User.username == 'susan'))
+        self.assertTrue(john.is_following(susan))
+        post = db.session.scalar(sa.select(Post))
+        self.assertEqual(post.author, john)
+        self.assertEqual(post.users, [susan])
+        self.assertEqual(post.due_date, datetime(2030, 1, 1, 12, 0))
+        self.assertIsNone(post.image_file)
+
+    def test_round_trip(self):
+        for fmt in ('ndjson', 'csv'):
+            counts = export_data(self.directory, fmt)
+            self.assertEqual(counts['user'], 2)
+            self.assertEqual(counts['followers'], 1)
+            self.reset_database()
+            counts = import_data(self.directory, fmt, batch_size=1)
+            self.assertEqual(counts['user'], 2)
+            self.assertEqual(counts['post_users'], 1)
+            self.assert_restored()
+
+    def test_resume_from_checkpoint(self):
+        export_data(self.directory)
+        self.reset_database()
+        # pretend a previous run loaded the first user and then died
+        with db.engine.begin() as conn:
+            conn.execute(db.metadata.tables['user'].insert(),
+                         {'id': 1, 'username': 'john',
+                          'email': 'john@example.com',
+                          'profile_pic': 'default.jpg'})
+            conn.execute(import_checkpoint.insert(),
+                         {'table_name': 'user', 'rows': 1})
+        counts = import_data(self.directory)
+        self.assertEqual(counts['user'], 1)
+        self.assert_restored()
+        self.assertEqual(db.session.scalar(
+            sa.select(sa.func.count()).select_from(import_checkpoint)), 0)
+        # without a checkpoint, loading into tables with rows is refused
+        with self.assertRaises(ClickException):
+            import_data(self.directory, resume=False)
+
+
+class APICase(unittest.TestCase):
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = app.test_client()
+
+        self.u1 = User(username='john', email='john@example.com')
+        self.u1.set_password('cat')
+        self.u2 = User(username='susan', email='susan@example.com')
+        self.u3 = User(username='mary', email='mary@example.com')
+        db.session.add_all([self.u1, self.u2, self.u3])
+        now = datetime.now(timezone.utc)
+        self.posts = [
+            Post(title=f'post {i}', body='body', author=author,
+                 timestamp=now + timedelta(seconds=i))
+            for i, author in enumerate([self.u1, self.u2, self.u3, self.u2])
+        ]
+        db.session.add_all(self.posts)
+        db.session.commit()
+        self.u1.follow(self.u2)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_headers(self):
+        credentials = base64.b64encode(b'john:cat').decode()
+        rv = self.client.post('/api/v1/tokens', headers={
+            'Authorization': f'Basic {credentials}'})
+        self.assertEqual(rv.status_code, 200)
+        return {'Authorization': f'Bearer {rv.json["token"]}'}
+
+    def test_token_required(self):
+        self.assertEqual(self.client.get('/api/v1/timeline').status_code, 401)
+        headers = self.get_headers()
+        self.assertEqual(
+            self.client.get('/api/v1/timeline', headers=headers).status_code,
+            200)
+        self.client.delete('/api/v1/tokens', headers=headers)
+        self.assertEqual(
+            self.client.get('/api/v1/timeline', headers=headers).status_code,
+            401)
+
+    def test_timeline_cursor_pagination(self):
+        headers = self.get_headers()
+        rv = self.client.get('/api/v1/timeline?limit=2&fields=id,title',
+                             headers=headers)
+        self.assertEqual(rv.json['items'], [
+            {'id': self.posts[3].id, 'title': 'post 3'},
+            {'id': self.posts[1].id, 'title': 'post 1'},
+        ])
+        rv = self.client.get(rv.json['_links']['next'], headers=headers)
+        self.assertEqual([post['id'] for post in rv.json['items']],
+                         [self.posts[0].id])
+        self.assertIsNone(rv.json['_meta']['next_cursor'])
+
+        rv = self.client.get('/api/v1/timeline?fields=nope', headers=headers)
+        self.assertEqual(rv.status_code, 400)
+
+        for url, values in (('/api/v1/posts',
+                             ['2024-01-01T00:00:00', {'a': 1}]),
+                            ('/api/v1/users', [{'a': 1}]),
+                            ('/api/v1/users', ['1']),
+                            ('/api/v1/users', [2 ** 70])):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps(values).encode()).decode()
+            rv = self.client.get(f'{url}?cursor={cursor}', headers=headers)
+            self.assertEqual(rv.status_code, 400, values)
+            self.assertEqual(rv.json['message'], 'Invalid cursor')
+
+    def test_batch(self):
+        headers = self.get_headers()
+        rv = self.client.post('/api/v1/batch', headers=headers, json={
+            'posts': [self.posts[2].id, 999, self.posts[0].id],
+            'users': [self.u2.id],
+            'fields': {'posts': ['id', 'author_id'],
+                       'users': ['username', 'follower_count']},
+        })
+        self.assertEqual(rv.json['posts'], [
+            {'id': self.posts[2].id, 'author_id': self.u3.id},
+            {'id': self.posts[0].id, 'author_id': self.u1.id},
+        ])
+        self.assertEqual(rv.json['users'],
+                         [{'username': 'susan', 'follower_count': 1}])
+
+    def test_batch_malformed(self):
+        headers = self.get_headers()
+        for body in ([1, 2], {'posts': [True]}, {'posts': ['1']},
+                     {'posts': [1], 'fields': {'posts': 5}},
+                     {'posts': [1], 'fields': {'posts': [1]}},
+                     {'posts': [1], 'fields': {'posts': [['id']]}},
+                     {'posts': [1], 'fields': ['id']}, {'posts': [2 ** 70]},
+                     {'users': [0]}):
+            rv = self.client.post('/api/v1/batch', headers=headers, json=body)
+            self.assertEqual(rv.status_code, 400, body)
+            self.assertIn('error', rv.json)
+
+    def test_internal_error_json(self):
+        headers = self.get_headers()
+        with mock.patch('app.api.batch.field_names', side_effect=RuntimeError):
+            rv = self.client.post('/api/v1/batch', headers=headers,
+                                  json={'posts': [1]})
+        self.assertEqual(rv.status_code, 500)
+        self.assertEqual(rv.json, {'error': 'Internal Server Error'})
+
+
+class QuestStatsCase(unittest.TestCase):
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def summaries(self):
+        quests = db.session.execute(sa.select(
+            QuestStats.quest_id, QuestStats.participant_count,
+            QuestStats.join_score, QuestStats.progress)
+            .order_by(QuestStats.quest_id)).all()
+        users = db.session.execute(sa.select(
+            ParticipantStats.user_id, ParticipantStats.quests_joined,
+            ParticipantStats.quests_completed)
+            .order_by(ParticipantStats.user_id)).all()
+        return quests, users
+
+    def test_leaderboards(self):
+        users = [User(username=f'user{i}', email=f'user{i}@example.com')
+                 for i in range(3)]
+        db.session.add_all(users)
+        q1 = Quest(title='hike', progress=0, creator=users[0])
+        q2 = Quest(title='bake', progress=50, creator=users[0])
+        create_quest(q1)
+        create_quest(q2)
+        db.session.commit()
+
+        old = datetime.now(timezone.utc) - timedelta(days=30)
+        join_quest(q1, users[0], when=old)
+        join_quest(q1, users[1], when=old)
+        self.assertTrue(join_quest(q2, users[2]))
+        self.assertFalse(join_quest(q2, users[2]))
+        db.session.commit()
+
+        self.assertEqual([q for q, _ in leaderboard('participants', 10)],
+                         [q1, q2])
+        self.assertEqual([q for q, _ in leaderboard('recent', 10)], [q2, q1])
+        self.assertEqual([q for q, _ in leaderboard('completion', 10)],
+                         [q2, q1])
+        self.assertEqual(q1.stats.participant_count, 2)
+
+        set_progress(q1, 100)
+        db.session.commit()
+        self.assertEqual([q for q, _ in leaderboard('completion', 1)], [q1])
+        top = top_participants(10)
+        self.assertEqual([u for u, _ in top][2], users[2])
+        self.assertEqual([s.quests_completed for _, s in top], [1, 1, 0])
+
+        set_progress(q1, 90)
+        db.session.commit()
+        self.assertEqual([s.quests_completed for _, s in top_participants(10)],
+                         [0, 0, 0])
+
+        incremental = self.summaries()
+        rebuild_stats()
+        rebuilt = self.summaries()
+        self.assertEqual(rebuilt[1], incremental[1])
+        for before, after in zip(incremental[0], rebuilt[0]):
+            self.assertEqual(before[:2], after[:2])
+            self.assertAlmostEqual(before[2], after[2])
+
+    def test_existing_joins(self):
+        users = [User(username=f'user{i}', email=f'user{i}@example.com')
+                 for i in range(4)]
+        db.session.add_all(users)
+        quest = Quest(title='hike', progress=100, creator=users[0])
+        db.session.add(quest)
+        db.session.commit()
+        # joins made before the summary tables existed
+        for user in users[:3]:
+            db.session.execute(quest_participants.insert().values(
+                user_id=user.id, quest_id=quest.id))
+        db.session.commit()
+        self.assertEqual(leaderboard('participants', 10), [])
+
+        join_quest(quest, users[3])
+        db.session.commit()
+        self.assertEqual(quest.stats.participant_count, 4)
+        self.assertEqual(db.session.get(ParticipantStats,
+                                        users[3].id).quests_completed, 1)
+
+        result = app.test_cli_runner().invoke(args=['quests', 'rebuild'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual([s.quests_completed
+                          for _, s in top_participants(10)], [1, 1, 1, 1])
+
+
+    def test_summary_row_created_concurrently(self):
+        user = User(username='john', email='john@example.com')
+        quest = Quest(title='hike', progress=0, creator=user)
+        db.session.add(quest)
+        db.session.commit()
+        # another request creates the summary rows between our check for
+        # them and our insert
+        get = db.session.get
+        rows = {QuestStats: {'quest_id': quest.id, 'participant_count': 0,
+                             'join_score': 0.0, 'progress': 0},
+                ParticipantStats: {'user_id': user.id, 'quests_joined': 0,
+                                   'quests_completed': 0}}
+
+        def racing_get(model, *args, **kwargs):
+            result = get(model, *args, **kwargs)
+            if model in rows:
+                db.session.execute(sa.insert(model), rows.pop(model))
+            return result
+
+        with mock.patch.object(db.session, 'get', racing_get):
+            self.assertTrue(join_quest(quest, user))
+        db.session.commit()
+        self.assertEqual(db.session.get(QuestStats, quest.id)
+                         .participant_count, 1)
+        self.assertEqual(db.session.get(ParticipantStats, user.id)
+                         .quests_joined, 1)
+
+class LoggingCase(unittest.TestCase):
+    def make_record(self, msg, lineno=10):
+        return logging.LogRecord('app', logging.ERROR, 'routes.py', lineno,
+                                 msg, None, None)
+
+    def test_mail_throttling(self):
+        handler = ThrottledSMTPHandler('localhost', 'from@example.com',
+                                       ['to@example.com'], 'Failure',
+                                       window=60, limit=2)
+        with mock.patch('logging.handlers.SMTPHandler.emit') as emit:
+            for i in range(3):
+                handler.emit(self.make_record('database is down'))
+            self.assertEqual(emit.call_count, 1)
+            handler.emit(self.make_record('disk is full', lineno=20))
+            handler.emit(self.make_record('out of memory', lineno=30))
+            self.assertEqual(emit.call_count, 2)
+
+            # a new window mails again and reports what was held back
+            handler._window_start -= 60
+            handler._last_sent = {}
+            handler.emit(self.make_record('database is down'))
+            self.assertEqual(emit.call_count, 3)
+            self.assertIn('(2 identical errors were not mailed)',
+                          emit.call_args[0][0].msg)
+
+    def test_json_records(self):
+        record = self.make_record('hello %s')
+        record.args = ('world',)
+        with app.test_request_context('/explore'):
+            g.request_id = 'abc123'
+            RequestContextFilter().filter(record)
+        data = json.loads(JSONFormatter().format(record))
+        self.assertEqual(data['message'], 'hello world')
+        self.assertEqual(data['level'], 'ERROR')
+        self.assertEqual(data['request_id'], 'abc123')
+        self.assertEqual(data['path'], '/explore')
+        self.assertNotIn('elapsed_ms', data)
+
+
+class SuggestionCase(unittest.TestCase):
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.users = [User(username=name, email=f'{name}@example.com')
+                      for name in ('john', 'susan', 'mary', 'david', 'ann')]
+        db.session.add_all(self.users)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def suggestions(self, user):
+        return [(u.username, score)
+                for u, score in suggested_users(user, 10)]
+
+    def test_suggestions(self):
+        john, susan, mary, david, ann = self.users
+        john.follow(susan)
+        susan.follow(mary)
+        susan.follow(david)
+        mary.follow(david)
+        post = Post(title='picnic', body='picnic', author=ann)
+        post.users.extend([john, david])
+        db.session.add(post)
+        db.session.commit()
+
+        self.assertEqual(update_suggestions(full=True), 5)
+        # david: followed by susan and co-joined the picnic
+        self.assertEqual(self.suggestions(john),
+                         [('david', 1.5), ('mary', 1.0)])
+        self.assertEqual(self.suggestions(mary), [])
+
+        # following drops the suggestion right away, and the incremental
+        # update refreshes john and the users that follow him
+        ann.follow(john)
+        john.follow(david)
+        db.session.commit()
+        self.assertEqual(self.suggestions(john), [('mary', 1.0)])
+        self.assertEqual(update_suggestions(), 3)
+        self.assertEqual(self.suggestions(john), [('mary', 1.0)])
+        self.assertEqual(self.suggestions(ann),
+                         [('david', 1.0), ('susan', 1.0)])
+        self.assertEqual(update_suggestions(), 0)
+
+
+class TrendingCase(unittest.TestCase):
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def join(self, post, user, when):
+        db.session.execute(post_users.insert().values(
+            user_id=user.id, post_id=post.id, timestamp=when))
+        record_join(post, when)
+
+    def test_trending(self):
+        now = datetime.now(timezone.utc)
+        users = [User(username=f'user{i}', email=f'user{i}@example.com')
+                 for i in range(3)]
+        author = User(username='author', email='author@example.com')
+        old = Post(title='old', body='old', author=author)
+        new = Post(title='new', body='new', author=author)
+        due = Post(title='due', body='due', author=author,
+                   due_date=(now + timedelta(hours=2)).replace(tzinfo=None))
+        quiet = Post(title='quiet', body='quiet', author=author)
+        db.session.add_all(users + [author, old, new, due, quiet])
+        db.session.commit()
+
+        # two joins two days ago decay below one join today
+        for user in users[:2]:
+            self.join(old, user, now - timedelta(days=2))
+        self.join(new, users[0], now - timedelta(minutes=1))
+        self.join(due, users[1], now - timedelta(minutes=1))
+        db.session.commit()
+
+        posts, has_next = trending_posts(1, 10)
+        self.assertEqual(posts, [due, new, old])
+        self.assertFalse(has_next)
+        self.assertEqual(trending_posts(1, 2)[1], True)
+
+        # refreshing later drops posts that left the window or went past due
+        later = now + timedelta(days=6)
+        self.assertEqual(refresh_trending(later), (1, 2))
+        self.assertEqual(trending_posts(1, 10)[0], [new])
+
+        self.assertEqual(rebuild_trending(now), 3)
+        self.assertEqual(trending_posts(1, 10)[0], [due, new, old])
+
+    def test_concurrent_joins(self):
+        now = datetime.now(timezone.utc)
+        half_life = timedelta(hours=app.config['TRENDING_HALF_LIFE_HOURS'])
+        author = User(username='author', email='author@example.com')
+        post = Post(title='hike', body='hike', author=author)
+        db.session.add(post)
+        db.session.commit()
+        record_join(post, now)
+        db.session.commit()
+        stale = db.session.get(PostTrend, post.id)
+        # another request counts a join after we loaded the row
+        score = decay_score(stale.join_score, now, half_life)
+        db.session.execute(
+            sa.update(PostTrend).values(join_score=score),
+            execution_options={'synchronize_session': False})
+        record_join(post, now)
+        db.session.commit()
+        self.assertAlmostEqual(db.session.get(PostTrend, post.id).join_score,
+                               decay_score(score, now, half_life))
+
+
+class ArchiveCase(unittest.TestCase):
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_archive_posts(self):
+        now = datetime.now(timezone.utc)
+        u1 = User(username='john', email='john@example.com')
+        u2 = User(username='susan', email='susan@example.com')
+        db.session.add_all([u1, u2])
+        posts = []
+        for i in range(5):
+            # the first three posts were due a year ago
+            due = now + timedelta(days=-365 if i < 3 else 1)
+            posts.append(Post(title=f'post {i}', body='body', author=u1,
+                              timestamp=now + timedelta(seconds=i),
+                              due_date=due.replace(tzinfo=None)))
+        db.session.add_all(posts)
+        db.session.commit()
+        posts[0].users.append(u2)
+        db.session.add(PostTrend(post_id=posts[0].id, join_score=1.0,
+                                 last_join=now, score=1.0))
+        db.session.commit()
+        ids = [post.id for post in posts]
+
+        self.assertEqual(archive_posts(batch_size=2), 3)
+        self.assertEqual(archive_posts(), 0)
+        self.assertEqual(db.session.scalars(sa.select(Post.id)).all(),
+                         ids[3:])
+        self.assertEqual(
+            db.session.scalars(sa.select(ArchivedPost.id)
+                               .order_by(ArchivedPost.id)).all(), ids[:3])
+        self.assertEqual(db.session.execute(
+            sa.select(post_users_archive.c.user_id,
+                      post_users_archive.c.post_id)).all(), [(u2.id, ids[0])])
+        self.assertIsNone(db.session.scalar(sa.select(post_users)))
+        archived = db.session.get(ArchivedPost, ids[0])
+        self.assertEqual(archived.users, [u2])
+        self.assertEqual(archived.author, u1)
+
+        # profile pages run through live posts, then into the archive
+        pages = [user_posts_page(u1, page, 2) for page in (1, 2, 3)]
+        self.assertEqual([[p.id for p in posts] for posts, _ in pages],
+                         [[ids[4], ids[3]], [ids[2], ids[1]], [ids[0]]])
+        self.assertEqual([has_next for _, has_next in pages],
+                         [True, True, False])
+
+    def test_archived_ids_not_reused(self):
+        u = User(username='john', email='john@example.com')
+        old = Post(title='old', body='body', author=u,
+                   due_date=datetime(2000, 1, 1))
+        db.session.add(old)
+        db.session.commit()
+        old_id = old.id
+        self.assertEqual(archive_posts(), 1)
+
+        new = Post(title='new', body='body', author=u,
+                   due_date=datetime(2000, 1, 1))
+        db.session.add(new)
+        db.session.commit()
+        self.assertGreater(new.id, old_id)
+        self.assertEqual(archive_posts(), 1)
+
+    def test_archived_ids_survive_import(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        u = User(username='john', email='john@example.com')
+        live = Post(title='live', body='body', author=u,
+                    due_date=datetime(2100, 1, 1))
+        old = Post(title='old', body='body', author=u,
+                   due_date=datetime(2000, 1, 1))
+        db.session.add_all([live, old])
+        db.session.commit()
+        user_id, old_id = u.id, old.id
+        self.assertEqual(archive_posts(), 1)
+
+        export_data(directory)
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        import_data(directory)
+        new = Post(title='new', body='body', user_id=user_id)
+        db.session.add(new)
+        db.session.commit()
+        self.assertGreater(new.id, old_id)
+
+
+class RateLimitCase(unittest.TestCase):
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.limits = app.config['RATELIMIT_USER']
+        app.config['RATELIMIT_USER'] = dict(self.limits, follow=(2, 60))
+        limiter._store = MemoryStore()
+
+    def tearDown(self):
+        app.config['RATELIMIT_USER'] = self.limits
+        del app.config['WTF_CSRF_ENABLED']
+        limiter._store = None
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_token_bucket(self):
+        store = MemoryStore()
+        self.assertEqual(store.take('k', 0.5, 2, now=0), 0)
+        self.assertEqual(store.take('k', 0.5, 2, now=0), 0)
+        self.assertEqual(store.take('k', 0.5, 2, now=0), 2)
+        self.assertEqual(store.take('k', 0.5, 2, now=1), 1)
+        self.assertEqual(store.take('k', 0.5, 2, now=2), 0)
+        # a refill never goes above capacity
+        self.assertEqual(store.take('k', 0.5, 2, now=100), 0)
+        self.assertEqual(store.take('k', 0.5, 2, now=100), 0)
+        self.assertEqual(store.take('k', 0.5, 2, now=100), 2)
+        self.assertEqual(store.take('other', 0.5, 2, now=100), 0)
+
+    def test_bucket_eviction(self):
+        store = MemoryStore(max_keys=2)
+        store.take('a', 0.5, 1, now=0)
+        store.take('b', 0.5, 1, now=0)
+        self.assertEqual(store.take('a', 0.5, 1, now=0), 2)
+        # 'b' is now the least recently used bucket, so it goes first
+        store.take('c', 0.5, 1, now=0)
+        self.assertEqual(len(store._buckets), 2)
+        self.assertEqual(store.take('a', 0.5, 1, now=0), 2)
+        self.assertEqual(store.take('b', 0.5, 1, now=0), 0)
+
+    def test_follow_limited(self):
+        u1 = User(username='john', email='john@example.com')
+        u1.set_password('cat')
+        u2 = User(username='susan', email='susan@example.com')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        client = app.test_client()
+        client.post('/login', data={'username': 'john', 'password': 'cat'})
+        self.assertEqual(client.post('/follow/susan').status_code, 302)
+        self.assertEqual(client.post('/unfollow/susan').status_code, 302)
+        rv = client.post('/follow/susan')
+        self.assertEqual(rv.status_code, 429)
+        self.assertEqual(rv.headers['Retry-After'], '30')
+        self.assertFalse(u1.is_following(u2))
+        # requests the user's bucket rejects leave the shared IP bucket be
+        for _ in range(5):
+            self.assertEqual(client.post('/follow/susan').status_code, 429)
+        tokens, _ = limiter.store._buckets['follow:ip:127.0.0.1']
+        self.assertLess(app.config['RATELIMIT_IP']['follow'][0] - tokens, 2.1)
+        # viewing pages is not limited
+        self.assertEqual(client.get('/user/susan').status_code, 200)
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)